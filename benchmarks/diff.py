@@ -0,0 +1,67 @@
+"""
+Time of diffing two large, mostly identical snapshots with diff, compared to GNU diff and difflib.SequenceMatcher
+Run from the repository root: python -m benchmarks.diff
+"""
+import os
+import random
+import subprocess
+import tempfile
+from difflib import SequenceMatcher
+from time import perf_counter
+
+from pysh import cat, cat_list, diff, to_file
+
+N = 10 ** 6
+CHANGES = 1000
+SEQUENCE_MATCHER_N = 10 ** 4  # SequenceMatcher is too slow for larger inputs
+
+
+def measure(func, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def snapshots(n):
+    random.seed(0)
+    old = ["host{:08} 10.{}.{}.{} up".format(i, i % 256, i // 256 % 256, random.randint(0, 255)) for i in range(n)]
+    new = list(old)
+    for _ in range(CHANGES * n // N):
+        position = random.randrange(len(new))
+        change = random.choice(["insert", "delete", "replace"])
+        if change == "insert":
+            new.insert(position, "host{:08} 10.0.0.0 new".format(random.randrange(n)))
+        elif change == "delete":
+            del new[position]
+        else:
+            new[position] = new[position][:-2] + "down"
+    return old, new
+
+
+def main():
+    old, new = snapshots(N)
+    small_old, small_new = snapshots(SEQUENCE_MATCHER_N)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        old_file, new_file = os.path.join(tmpdir, "old"), os.path.join(tmpdir, "new")
+        cat_list(old) | to_file(old_file)
+        cat_list(new) | to_file(new_file)
+        benchmarks = {
+            "GNU diff": lambda: subprocess.run(["diff", old_file, new_file], stdout=subprocess.DEVNULL),
+            "GNU diff -u": lambda: subprocess.run(["diff", "-u", old_file, new_file], stdout=subprocess.DEVNULL),
+            "diff": lambda: diff(cat(old_file), cat(new_file)),
+            "diff, unified": lambda: diff(cat(old_file), cat(new_file), output="unified"),
+            "diff, window=10000": lambda: list(diff(cat(old_file), cat(new_file), window=10000)),
+            "SequenceMatcher, 1% of lines": lambda: SequenceMatcher(a=small_old, b=small_new).get_opcodes(),
+            "diff, 1% of lines": lambda: diff(small_old, small_new),
+        }
+        print("{} lines, {} changes".format(N, CHANGES))
+        print("{:30} {:>10}".format("method", "seconds"))
+        for name, func in benchmarks.items():
+            print("{:30} {:10.3f}".format(name, measure(func)))
+
+
+if __name__ == '__main__':
+    main()
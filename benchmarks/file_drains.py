@@ -0,0 +1,45 @@
+"""
+Throughput of writing a large stream of lines to a file with to_file, compared to cat > file
+Run from the repository root: python -m benchmarks.file_drains
+"""
+import os
+import subprocess
+import tempfile
+from time import perf_counter
+
+from pysh import cat_list, to_file
+
+N = 5 * 10 ** 6
+
+
+def measure(func, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def main():
+    lines = ["{:08} some payload of the line".format(i) for i in range(N)]
+    byte_lines = [line.encode() + b"\n" for line in lines]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source, target = os.path.join(tmpdir, "source"), os.path.join(tmpdir, "target")
+        cat_list(lines) | to_file(source)
+        size = os.path.getsize(source)
+        benchmarks = {
+            "cat > file": lambda: subprocess.run("cat {} > {}".format(source, target), shell=True, check=True),
+            "to_file, line by line": lambda: cat_list(lines) | to_file(target, batch_size=1),
+            "to_file": lambda: cat_list(lines) | to_file(target),
+            "to_file, binary": lambda: cat_list(byte_lines) | to_file(target, mode="wb"),
+            "to_file, atomic": lambda: cat_list(lines) | to_file(target, atomic=True),
+            "to_file, atomic, fsync": lambda: cat_list(lines) | to_file(target, atomic=True, fsync="close"),
+        }
+        print("{:28} {:>10}".format("drain", "MB/s"))
+        for name, func in benchmarks.items():
+            print("{:28} {:10.1f}".format(name, size / measure(func) / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Per-element overhead of chains of cheap pipe elements, with and without fusing them into a single loop
+Run from the repository root: python -m benchmarks.fusion
+"""
+import importlib
+from time import perf_counter
+
+from pysh import cat_list, rev, grep, to_list
+
+generator_module = importlib.import_module("pysh.generator")  # pysh.generator attribute is the generator function
+
+N = 10 ** 6
+
+
+def pipelines(lines):
+    return {
+        "str.strip | str.lower": lambda: cat_list(lines) | str.strip | str.lower | to_list(),
+        "str.strip | str.lower | rev()": lambda: cat_list(lines) | str.strip | str.lower | rev() | to_list(),
+        "str.strip | grep | str.upper | rev()":
+            lambda: cat_list(lines) | str.strip | grep("1") | str.upper | rev() | to_list(),
+    }
+
+
+def measure(pipeline, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        pipeline()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def main():
+    lines = [" Line {} ".format(i) for i in range(N)]
+    print("{:40} {:>12} {:>12}".format("pipeline", "nested ns/el", "fused ns/el"))
+    for name, pipeline in pipelines(lines).items():
+        generator_module.FUSE_PIPES = False
+        nested = measure(pipeline)
+        generator_module.FUSE_PIPES = True
+        fused = measure(pipeline)
+        print("{:40} {:12.1f} {:12.1f}".format(name, nested / N * 1e9, fused / N * 1e9))
+
+
+if __name__ == '__main__':
+    main()
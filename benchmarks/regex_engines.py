@@ -0,0 +1,62 @@
+"""
+grep and sed throughput with the re and regex engines, and cost of rebuilding pipelines (with the shared cache
+of compiled patterns), plus searching files in parallel - by processes with re, by threads with regex
+Run from the repository root: python -m benchmarks.regex_engines
+"""
+import os
+import random
+import shutil
+import tempfile
+from time import perf_counter
+
+from pysh import cat_list, grep, sed, to_list, Flags, set_regex_engine
+from pysh.regex_engine import ENGINES
+
+N = 10 ** 6
+REBUILDS = 10 ** 5
+FILES = 2000
+
+
+def measure(func, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def make_tree(root, lines):
+    for i in range(FILES):
+        with open(os.path.join(root, "{}.txt".format(i)), "w") as outfile:
+            outfile.write("\n".join(random.sample(lines, 200)))
+
+
+def main():
+    random.seed(0)
+    lines = ["{} user{} GET /item/{}".format(i, random.randint(0, 999), random.randint(0, 10 ** 6)) for i in range(N)]
+    benchmarks = {
+        "grep ns/el": (N / 1e9, lambda: cat_list(lines) | grep(r"user9\d+ GET /item/1") | to_list()),
+        "grep I ns/el": (N / 1e9, lambda: cat_list(lines) | grep(r"USER9\d+", Flags.I) | to_list()),
+        "sed G ns/el": (N / 1e9, lambda: cat_list(lines) | sed("s", r"\d+", "#", Flags.G) | to_list()),
+        "rebuild us/pipeline": (REBUILDS / 1e6, lambda: [grep(r"user(\d+) GET") for _ in range(REBUILDS)]),
+    }
+    root = tempfile.mkdtemp()
+    try:
+        make_tree(root, lines)
+        benchmarks["grep files us/file"] = (FILES / 1e6, lambda: list(grep(
+            r"user9\d+ GET /item/1", files=root, recursive=True)))
+        print("{:24}".format("benchmark") + "".join("{:>12}".format(engine) for engine in ENGINES))
+        for name, (units, func) in benchmarks.items():  # e.g. N / 1e9 units to get ns per element
+            results = []
+            for engine in ENGINES:
+                set_regex_engine(engine)
+                results.append(measure(func) / units)
+            print("{:24}".format(name) + "".join("{:12.1f}".format(result) for result in results))
+    finally:
+        set_regex_engine("re")
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
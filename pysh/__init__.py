@@ -1,12 +1,19 @@
 from .generator import (pipe_from_func, make_pipe, make_drain, make_source,
-                        generator, tqdm_wrapper, split_sequence,run_command, CommandError
+                        generator, tqdm_wrapper, split_sequence,run_command, CommandError,
+                        batched, unbatched, iter_batches
                         )
 from .main import (sort, uniq, grep, cut, wc,
                    rev, sed,
-                   comm, diff,
-                   head, tail,
+                   comm, diff, merge,
+                   head, tail, cmd,
                    Flags
                    )
-from .file_utils import ls, cd, rm, mv, pwd, touch, mkdir, find
-from .sources import cat, cat_list, bz2_cat
-from .drains import echo, to_file, to_list, to_bz2
+from .file_utils import ls, cd, rm, mv, pwd, touch, mkdir, find, diff_tree
+from .sources import cat, cat_list, bz2_cat, gz_cat, xz_cat, zcat, sh, IndexedFile
+from .drains import echo, to_file, to_list, to_bz2, to_gz, to_xz
+from .parallel import pmap, buffer, tee, fork
+from .aggregate import group_by, count_by, dedup
+from .sketches import top_k, count_distinct, quantiles
+from .regex_engine import set_regex_engine, compile_regex
+from .async_generator import (AsyncGenerator, make_async_source, make_async_pipe, make_async_drain,
+                              async_cat, async_sh)
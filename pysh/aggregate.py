@@ -0,0 +1,245 @@
+import heapq
+import os
+import pickle
+import tempfile
+from collections import Counter
+from itertools import chain
+from operator import add
+
+from .generator import Generator, iter_batches, DEFAULT_BATCH_SIZE
+from .main import _read_run, _spill_run
+from .sketches import BloomFilter
+
+# name: (initial partial aggregate from a value, partial aggregate updated with a value,
+#        two partial aggregates merged, final value from partial aggregate)
+_AGGREGATES = {
+    "count": (lambda value: 1, lambda acc, value: acc + 1, add, None),
+    "sum": (None, add, add, None),
+    "min": (None, min, min, None),
+    "max": (None, max, max, None),
+    "mean": (lambda value: (value, 1), lambda acc, value: (acc[0] + value, acc[1] + 1),
+             lambda acc1, acc2: (acc1[0] + acc2[0], acc1[1] + acc2[1]), lambda acc: acc[0] / acc[1]),
+}
+_SPILL_PARTITIONS = 16
+_MAX_SPILL_DEPTH = 8  # keys with the same hash can't be split, so repartitioning stops somewhere
+_MISSING = object()
+
+
+class group_by(Generator):
+    """
+    Groups the elements by key and aggregates each group, generating (key, aggregated value) tuples;
+    the order of the groups is not specified
+    Params:
+    key - function computing the key of an element; by default the element itself is the key
+    agg - aggregate function: "count", "sum", "min", "max" or "mean", or a list of them - then the aggregated value
+        is a tuple
+    value - function computing the aggregated value of an element; by default the element itself
+    max_keys - if there are more distinct keys, the partial aggregates are spilled to temporary files, partitioned
+        by the hash of the key, and the partitions are aggregated one by one at the end (partitions with more keys
+        are split further); by default everything is kept in memory
+    """
+
+    def __init__(self, key=None, agg="count", value=None, max_keys=None):
+        super().__init__(None)
+        self.key = key
+        self.aggs = [agg] if isinstance(agg, str) else list(agg)
+        for name in self.aggs:
+            if name not in _AGGREGATES:
+                raise ValueError("Unknown aggregate function '{}', available: {}".format(name, ", ".join(_AGGREGATES)))
+        self.single = isinstance(agg, str)
+        self.value = value
+        self.max_keys = max_keys
+
+    def _functions(self):
+        """Initial, update and merge functions for partial aggregates of all the aggregate functions at once"""
+        inits, updates, merges = zip(*((init or (lambda value: value), update, merge)
+                                       for init, update, merge, _ in map(_AGGREGATES.get, self.aggs)))
+        if self.single:
+            return inits[0], updates[0], merges[0]
+        return (lambda value: tuple(init(value) for init in inits),
+                lambda acc, value: tuple(update(a, value) for update, a in zip(updates, acc)),
+                lambda acc1, acc2: tuple(merge(a1, a2) for merge, a1, a2 in zip(merges, acc1, acc2)))
+
+    def _final(self, acc):
+        finals = [_AGGREGATES[name][3] for name in self.aggs]
+        if self.single:
+            return acc if finals[0] is None else finals[0](acc)
+        return tuple(a if final is None else final(a) for final, a in zip(finals, acc))
+
+    def _partial_tables(self):
+        """Generates dicts of partial aggregates, each time the number of keys exceeds max_keys and at the end"""
+        init, update, _ = self._functions()
+        key, value = self.key, self.value
+        table = {}
+        for batch in iter_batches(self.source, DEFAULT_BATCH_SIZE):
+            keys = batch if key is None else map(key, batch)
+            values = batch if value is None else map(value, batch)
+            for k, v in zip(keys, values):
+                acc = table.get(k, _MISSING)
+                table[k] = init(v) if acc is _MISSING else update(acc, v)
+            if self.max_keys is not None and len(table) > self.max_keys:
+                yield table
+                table = {}
+        yield table
+
+    def gen(self):
+        tables = self._partial_tables()
+        table = next(tables)
+        last = next(tables, None)
+        if last is None:  # everything fitted in memory
+            yield from ((k, self._final(acc)) for k, acc in table.items())
+            return
+        with tempfile.TemporaryDirectory(prefix="pysh_group_") as tmp_dir:
+            partitions = _partition_names(os.path.join(tmp_dir, "partition"))
+            for partial in chain([table, last], tables):
+                _spill_partitions(partial.items(), partitions, 0)
+            for partition in partitions:
+                for merged in self._merged_tables(partition, 1):
+                    yield from ((k, self._final(acc)) for k, acc in merged.items())
+
+    def _merged_tables(self, partition, depth):
+        """
+        Generates the partial aggregates from the partition file merged into dicts of at most max_keys keys;
+        if the partition has more keys, it is split again (by the hash salted with depth) and merged part by part
+        """
+        if not os.path.exists(partition):
+            return
+        _, _, merge = self._functions()
+        merged = {}
+        subpartitions = None
+        for k, acc in _read_run(partition):
+            prev = merged.get(k, _MISSING)
+            merged[k] = acc if prev is _MISSING else merge(prev, acc)
+            if len(merged) > self.max_keys and depth < _MAX_SPILL_DEPTH:
+                subpartitions = subpartitions or _partition_names(partition)
+                _spill_partitions(merged.items(), subpartitions, depth)
+                merged = {}
+        os.remove(partition)
+        if subpartitions is None:
+            yield merged
+            return
+        _spill_partitions(merged.items(), subpartitions, depth)
+        for subpartition in subpartitions:
+            yield from self._merged_tables(subpartition, depth + 1)
+
+
+def _partition_names(prefix):
+    return ["{}_{}".format(prefix, i) for i in range(_SPILL_PARTITIONS)]
+
+
+def _spill_partitions(items, partitions, depth):
+    """
+    Appends the (key, value) items to the partition files, according to the hash of the key; every depth of
+    repartitioning salts the hash differently, so that the keys of one partition are spread over the next ones
+    """
+    parts = [[] for _ in partitions]
+    for item in items:
+        parts[hash((depth, item[0]) if depth else item[0]) % len(partitions)].append(item)
+    for items, filename in zip(parts, partitions):
+        if items:
+            with open(filename, "ab") as outfile:
+                pickle.dump(items, outfile, pickle.HIGHEST_PROTOCOL)
+
+
+class count_by(group_by):
+    """
+    Counts the elements by key (by default the element itself), generating (key, count) tuples;
+    the same as group_by(key, "count", max_keys=max_keys), but faster
+    """
+
+    def __init__(self, key=None, max_keys=None):
+        super().__init__(key, "count", max_keys=max_keys)
+
+    def _partial_tables(self):
+        counts = Counter()
+        for batch in iter_batches(self.source, DEFAULT_BATCH_SIZE):
+            counts.update(batch if self.key is None else map(self.key, batch))
+            if self.max_keys is not None and len(counts) > self.max_keys:
+                yield counts
+                counts = Counter()
+        yield counts
+
+
+class dedup(Generator):
+    """
+    Filters out repeated elements, wherever they are in the input (unlike uniq, which removes only consecutive ones),
+    keeping the first occurrences in the input order; elements are repeated if they (or their keys) are equal,
+    as in a set, so they (or their keys) need to be hashable
+    Params:
+    key - function computing the key of an element, deciding if it is repeated; by default the element itself
+    max_keys - if there are more distinct keys, the rest of the input is spilled to temporary files, partitioned by
+        the hash of the key, and deduplicated partition by partition at the end (partitions with more keys are split
+        further) - the result is exact and in input order, but the elements after the spill are generated only after
+        the whole input is read; the spilled elements and keys need to be picklable
+    false_positive_rate - if given, only a Bloom filter sized for capacity distinct elements is kept, which uses
+        much less memory (about 10 bits per element for 1%), but drops the given fraction of the unique elements
+        as if they were repeated; the filter hashes canonical bytes of the keys: strings and bytes never match,
+        equal numbers do, and other keys are pickled, so they match only if their pickles are the same
+    """
+
+    def __init__(self, key=None, max_keys=None, false_positive_rate=None, capacity=10 ** 6):
+        super().__init__(None)
+        self.key = key
+        self.max_keys = max_keys
+        self.false_positive_rate = false_positive_rate
+        self.capacity = capacity
+
+    def gen(self):
+        key = self.key
+        if self.false_positive_rate is not None:
+            seen = BloomFilter(self.capacity, self.false_positive_rate)
+            yield from (elem for elem in self.source if not seen.add(elem if key is None else key(elem)))
+            return
+        seen = set()
+        elements = iter(self.source)
+        for elem in elements:
+            k = elem if key is None else key(elem)
+            if k in seen:
+                continue
+            if self.max_keys is not None and len(seen) >= self.max_keys:
+                yield from self._spilled(seen, chain([elem], elements))
+                return
+            seen.add(k)
+            yield elem
+
+    def _spilled(self, seen, elements):
+        """Deduplicates the elements not seen so far on disk; they are generated in input order"""
+        key = self.key
+        with tempfile.TemporaryDirectory(prefix="pysh_dedup_") as tmp_dir:
+            partitions = _partition_names(os.path.join(tmp_dir, "partition"))
+            index = 0
+            for batch in iter_batches(elements, DEFAULT_BATCH_SIZE):
+                keys = batch if key is None else map(key, batch)
+                items = [(k, (i, elem)) for i, k, elem in zip(range(index, index + len(batch)), keys, batch)
+                         if k not in seen]
+                _spill_partitions(items, partitions, 0)
+                index += len(batch)
+            seen.clear()
+            runs = [run for partition in partitions for run in self._first_runs(partition, 1)]
+            yield from (elem for _, elem in heapq.merge(*map(_read_run, runs), key=lambda item: item[0]))
+
+    def _first_runs(self, partition, depth):
+        """
+        Generates names of files with the first occurrences of the keys from the partition file, as (index, element)
+        sorted by index; if the partition has more than max_keys keys, it is split again (by the hash salted
+        with depth) and deduplicated part by part
+        """
+        if not os.path.exists(partition):
+            return
+        first = {}
+        for k, item in _read_run(partition):
+            if k not in first:
+                first[k] = item
+                if len(first) > self.max_keys and depth < _MAX_SPILL_DEPTH:
+                    break
+        else:
+            os.remove(partition)
+            yield _spill_run(list(first.values()), partition + ".run")  # dicts keep insertion order
+            return
+        first = None
+        subpartitions = _partition_names(partition)
+        for batch in iter_batches(_read_run(partition), DEFAULT_BATCH_SIZE):
+            _spill_partitions(batch, subpartitions, depth)
+        os.remove(partition)
+        for subpartition in subpartitions:
+            yield from self._first_runs(subpartition, depth + 1)
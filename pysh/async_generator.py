@@ -0,0 +1,298 @@
+import asyncio
+from asyncio.subprocess import PIPE
+from concurrent.futures import ThreadPoolExecutor
+
+from .generator import (Generator, PipeElement, generator, iter_batches, CommandError, _kill_command,
+                        _strip_newline)
+from .sources import cat
+
+ASYNC_BATCH_SIZE = 1024  # number of elements passed at once between the event loop and the threads
+_MAX_STDERR = 64 * 1024
+
+
+async def _iterate_in_executor(iterable, executor=None):
+    """Asynchronously iterates over a synchronous iterable, getting its elements in batches in the executor"""
+    loop = asyncio.get_running_loop()
+    batches = iter_batches(iterable, ASYNC_BATCH_SIZE)
+    while True:
+        batch = await loop.run_in_executor(executor, next, batches, None)
+        if batch is None:
+            return
+        for elem in batch:
+            yield elem
+
+
+def _as_async(iterable):
+    if "__aiter__" in dir(iterable):
+        return iterable
+    return _iterate_in_executor(iterable)
+
+
+async def _next_batch(aiterator):
+    batch = []
+    async for elem in aiterator:
+        batch.append(elem)
+        if len(batch) >= ASYNC_BATCH_SIZE:
+            break
+    return batch or None
+
+
+class _Bridge:
+    """
+    Synchronous iterator over an asynchronous one, for use in a thread other than the one of the event loop
+    The loop is set when the pipeline starts running
+    """
+
+    def __init__(self, aiterable):
+        self.aiterator = aiterable.__aiter__()
+        self.loop = None
+        self._batch = iter(())
+        self._future = None
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._batch)
+        except StopIteration:
+            pass
+        if self._closed:
+            raise StopIteration()
+        self._future = asyncio.run_coroutine_threadsafe(_next_batch(self.aiterator), self.loop)
+        batch = self._future.result()
+        if batch is None:
+            self._closed = True
+            raise StopIteration()
+        self._batch = iter(batch)
+        return next(self._batch)
+
+    def close(self):
+        self._closed = True
+        if self._future is not None:
+            self._future.cancel()
+
+
+async def _run_drain(drain, stage, bridge):
+    """Runs synchronous drain (fed by the bridge from the event loop) in a separate thread"""
+    loop = asyncio.get_running_loop()
+    if bridge is not None:
+        bridge.loop = loop
+    executor = ThreadPoolExecutor(1, thread_name_prefix="pysh-async")
+    try:
+        return await loop.run_in_executor(executor, drain.__ror__, stage)
+    finally:
+        if bridge is not None:
+            bridge.close()
+        executor.shutdown(wait=False)
+
+
+class AsyncGenerator(PipeElement):
+    """
+    Asynchronous counterpart of Generator, iterated with async for;
+    bitwise-or operator creates pipelines, mixing asynchronous and synchronous pipe elements:
+    synchronous pipe elements and functions are run in a separate thread, so that they don't block the event loop,
+    drains (both synchronous and made with make_async_drain) return awaitables and coroutine functions
+    are awaited for every element
+    """
+
+    def __init__(self, agen=None):
+        if agen is None:
+            self._agen = self.gen()
+        elif "__aiter__" in dir(agen):
+            self._agen = agen.__aiter__()
+        else:
+            self._agen = _iterate_in_executor(agen)
+        self._source = None
+
+    @property
+    def source(self):
+        return self._source
+
+    @source.setter
+    def source(self, src):
+        if "__aiter__" in dir(src):
+            self._source = src
+        elif "__iter__" in dir(src):
+            self._source = _iterate_in_executor(src)
+        else:
+            raise TypeError("Source needs to be iterable or asynchronously iterable")
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._agen.__anext__()
+
+    def __ror__(self, other):
+        self.source = other
+        return self
+
+    def __or__(self, other):
+        if isinstance(other, AsyncGenerator) or isinstance(other, _AsyncDrain):
+            return other.__ror__(self)
+        elif isinstance(other, PipeElement) and not isinstance(other, Generator):  # synchronous drain
+            bridge = _Bridge(self)
+            return _run_drain(other, generator(bridge), bridge)
+        elif asyncio.iscoroutinefunction(other):
+            return _async_map(other).__ror__(self)
+        else:
+            return _OffloadedPipe(self, other)
+
+
+class _OffloadedPipe(AsyncGenerator):
+    """Synchronous pipe elements, run in a dedicated thread and fed with elements of asynchronous source"""
+
+    def __init__(self, source, stage):
+        super().__init__()
+        self._bridge = _Bridge(source)
+        self.stage = generator(self._bridge) | stage
+
+    def __or__(self, other):
+        if isinstance(other, (AsyncGenerator, _AsyncDrain)) or asyncio.iscoroutinefunction(other):
+            return super().__or__(other)
+        elif isinstance(other, PipeElement) and not isinstance(other, Generator):  # synchronous drain
+            return _run_drain(other, self.stage, self._bridge)
+        else:
+            self.stage = self.stage | other  # consecutive synchronous elements run together in the same thread
+            return self
+
+    async def gen(self):
+        loop = asyncio.get_running_loop()
+        self._bridge.loop = loop
+        executor = ThreadPoolExecutor(1, thread_name_prefix="pysh-async")
+        batches = iter_batches(self.stage, ASYNC_BATCH_SIZE)
+        try:
+            while True:
+                batch = await loop.run_in_executor(executor, next, batches, None)
+                if batch is None:
+                    return
+                for elem in batch:
+                    yield elem
+        finally:
+            self._bridge.close()
+            executor.shutdown(wait=False)
+
+
+def make_async_source(func):
+    """Decorator for an asynchronous generator function, making it available for piping"""
+
+    class decorator(AsyncGenerator):
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(None)
+            self.args = args
+            self.kwargs = kwargs
+
+        async def gen(self):
+            async for elem in func(*self.args, **self.kwargs):
+                yield elem
+
+    return decorator
+
+
+def make_async_pipe(func):
+    """
+    Decorator for an asynchronous generator function, turning it to asynchronous pipe element
+    the decorated function is called with the (asynchronously iterable) source as the first argument
+    """
+
+    class decorator(AsyncGenerator):
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(None)
+            self.args = args
+            self.kwargs = kwargs
+
+        async def gen(self):
+            async for elem in func(self.source, *self.args, **self.kwargs):
+                yield elem
+
+    return decorator
+
+
+class _AsyncDrain(PipeElement):
+    pass  # marker class
+
+
+def make_async_drain(func):
+    """
+    Decorator for a coroutine function that is designed to be the last element in pipe;
+    piping to it returns an awaitable, e.g. await (async_cat("filename") | grep("pattern") | save())
+    """
+
+    class drain(_AsyncDrain):
+        def __init__(self, *args, **kwargs):
+            self.args = args
+            self.kwargs = kwargs
+
+        def __ror__(self, source):
+            return func(_as_async(source), *self.args, **self.kwargs)
+
+    return drain
+
+
+@make_async_pipe
+async def _async_map(source, func):
+    async for elem in source:
+        yield await func(elem)
+
+
+@make_async_source
+async def async_cat(filename):
+    """Asynchronously generates all content from given file line by line, reading it in a thread"""
+    async for line in _iterate_in_executor(cat(filename)):
+        yield line
+
+
+async def _read_bounded(stream, limit=_MAX_STDERR):
+    """Reads the whole stream, retaining only its last limit bytes"""
+    data = bytearray()
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            return bytes(data)
+        data += chunk
+        del data[:-limit]
+
+
+async def _read_lines(stream):
+    """Generates lines of the stream, however long (iterating over the stream raises ValueError above its limit)"""
+    parts = []
+    while True:
+        try:
+            parts.append(await stream.readuntil(b"\n"))
+        except asyncio.IncompleteReadError as error:
+            if parts or error.partial:
+                yield b"".join(parts) + error.partial
+            return
+        except asyncio.LimitOverrunError as error:
+            parts.append(await stream.readexactly(error.consumed))
+            continue
+        yield b"".join(parts)
+        parts = []
+
+
+@make_async_source
+async def async_sh(command, encoding="utf-8", raise_on_error=True):
+    """
+    Runs given shell command asynchronously and generates its output line by line, stripping newline characters
+    If the command returns non-zero exit code CommandError is raised (unless raise_on_error is False)
+    If the pipeline stops consuming the output early, the process is killed
+    """
+    process = await asyncio.create_subprocess_shell(command, stdout=PIPE, stderr=PIPE, start_new_session=True)
+    stderr = asyncio.ensure_future(_read_bounded(process.stderr))
+    try:
+        async for line in _read_lines(process.stdout):
+            yield _strip_newline(line.decode(encoding))
+        returncode = await process.wait()
+        error = (await stderr).decode(encoding, errors="replace")
+        if returncode != 0 and raise_on_error:
+            raise CommandError('Command returned {} exit code. Stderr:\n{}'.format(returncode, error))
+    finally:
+        if process.returncode is None:
+            _kill_command(process)
+            await process.stdout.read()  # the process is reported finished only after its output is read to the end
+            await process.wait()
+        stderr.cancel()
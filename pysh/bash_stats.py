@@ -1,10 +1,7 @@
-from collections import Counter
 import sys
-from generator import cat
-
-stats = Counter()
+from collections import Counter
 
-for fname in sys.argv[1:]:
-    for line in cat(fname):
-        stats += Counter(line.split())
+from pysh import cat, count_by, generator
 
+words = (word for fname in sys.argv[1:] for line in cat(fname) for word in line.split())
+stats = Counter(dict(generator(words) | count_by()))
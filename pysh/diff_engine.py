@@ -0,0 +1,345 @@
+"""
+Diff engine used by diff - finds the differences between two sequences of lines without difflib.SequenceMatcher,
+which is superlinear and drops frequent lines as junk, so it doesn't cope with files of millions of lines
+Common prefix and suffix are skipped with slice comparisons, and the rest is aligned with patience diff
+(lines unique in both sequences are matched as anchors, and the parts between them are aligned recursively),
+falling back to linear-space Myers O(ND) algorithm for the parts without unique lines
+Differences are described with difflib-like opcodes (tag, i1, i2, j1, j2, lines1, lines2), where lines are
+the elements of seq1[i1:i2] and seq2[j1:j2], so that they can be formatted also when the input is streamed
+"""
+from collections import Counter, deque
+from itertools import islice, compress, count, repeat
+from operator import itemgetter, sub
+
+_NO_MATCH = -2  # differs by more than 1 from every position, so it never extends a run
+_MAX_EDIT_COST = 256  # Myers algorithm splits the part where it got furthest after that many steps from each end
+
+
+def _common_prefix(a, alo, ahi, b, blo, bhi):
+    """Length of the common prefix of a[alo:ahi] and b[blo:bhi], found with slice comparisons of growing size"""
+    length, step = 0, 1
+    limit = min(ahi - alo, bhi - blo)
+    while step:
+        step = min(step, limit - length)
+        if step and a[alo + length:alo + length + step] == b[blo + length:blo + length + step]:
+            length += step
+            step *= 2
+        else:
+            step //= 2
+    return length
+
+
+def _common_suffix(a, alo, ahi, b, blo, bhi):
+    length, step = 0, 1
+    limit = min(ahi - alo, bhi - blo)
+    while step:
+        step = min(step, limit - length)
+        if step and a[ahi - length - step:ahi - length] == b[bhi - length - step:bhi - length]:
+            length += step
+            step *= 2
+        else:
+            step //= 2
+    return length
+
+
+def _anchors(a, alo, ahi, b, blo, bhi):
+    """
+    Matching (i, j, size) runs of lines unique in both a[alo:ahi] and b[blo:bhi], in increasing order, chosen to match
+    as many of them as possible (patience diff, weighted by the runs, so that long identical parts are cheap)
+    Everything but the choice of the runs is done with builtins, without looping over the lines in Python
+    """
+    lines_a, lines_b = a[alo:ahi], b[blo:bhi]
+    positions_b = dict(zip(lines_b, range(blo, bhi)))
+    if len(positions_b) < len(lines_b):
+        _remove_repeated(positions_b, lines_b)
+    if len(set(lines_a)) < len(lines_a):
+        _remove_repeated(positions_b, lines_a)
+    matches = list(map(positions_b.get, lines_a, repeat(_NO_MATCH)))
+    starts = list(compress(count(1), map((1).__ne__, map(sub, matches[1:], matches[:-1]))))
+    runs = [[alo + start, matches[start], stop - start] for start, stop in zip([0] + starts, starts + [len(matches)])
+            if matches[start] != _NO_MATCH]
+    return _heaviest_increasing(runs)
+
+
+def _remove_repeated(positions, lines):
+    for line, occurrences in Counter(lines).items():
+        if occurrences > 1:
+            positions.pop(line, None)
+
+
+def _heaviest_increasing(runs):
+    """Subsequence of the runs (sorted by i) increasing in j with the largest total size, found with Fenwick tree"""
+    ranks = [0] * len(runs)
+    for rank, index in enumerate(sorted(range(len(runs)), key=lambda index: runs[index][1]), 1):
+        ranks[index] = rank
+    tree = [(0, None)] * (len(runs) + 1)  # (best total size, index of its last run) for prefixes of ranks
+    previous = []
+    for index, run in enumerate(runs):
+        best = (0, None)
+        position = ranks[index] - 1
+        while position > 0:
+            best = max(best, tree[position], key=itemgetter(0))
+            position -= position & -position
+        previous.append(best[1])
+        value = (best[0] + run[2], index)
+        position = ranks[index]
+        while position < len(tree):
+            if tree[position][0] < value[0]:
+                tree[position] = value
+            position += position & -position
+    index = max(tree, key=itemgetter(0))[1]
+    result = []
+    while index is not None:
+        result.append(tuple(runs[index]))
+        index = previous[index]
+    return result[::-1]
+
+
+def _middle_split(a, alo, ahi, b, blo, bhi):
+    """
+    Point (x, y) where the shortest edit script of a[alo:ahi] and b[blo:bhi] can be split in two cheaper ones, found
+    with linear-space Myers algorithm (searching from both ends for the middle snake, like GNU diff); the parts have
+    to differ at both ends. If the script costs more than 2 * _MAX_EDIT_COST, the point reached furthest from either
+    end is returned instead, so that the parts are still split and the rest is aligned on smaller ranges
+    """
+    dmin, dmax = alo - bhi, ahi - blo  # diagonals are x - y
+    fmid, bmid = alo - blo, ahi - bhi
+    odd = (fmid - bmid) & 1
+    shift = 1 - dmin
+    fd = [-1] * (dmax - dmin + 3)  # furthest x on each diagonal reached from the start
+    bd = [ahi + 1] * (dmax - dmin + 3)  # and from the end
+    fd[fmid + shift], bd[bmid + shift] = alo, ahi
+    fmin = fmax = fmid
+    bmin = bmax = bmid
+    for _ in range(_MAX_EDIT_COST):
+        if fmin > dmin:
+            fmin -= 1
+            fd[fmin - 1 + shift] = -1
+        else:
+            fmin += 1
+        if fmax < dmax:
+            fmax += 1
+            fd[fmax + 1 + shift] = -1
+        else:
+            fmax -= 1
+        for d in range(fmax, fmin - 1, -2):
+            low, high = fd[d - 1 + shift], fd[d + 1 + shift]
+            x = low + 1 if low >= high else high
+            y = x - d
+            while x < ahi and y < bhi and a[x] == b[y]:
+                x += 1
+                y += 1
+            fd[d + shift] = x
+            if odd and bmin <= d <= bmax and bd[d + shift] <= x:
+                return x, y
+        if bmin > dmin:
+            bmin -= 1
+            bd[bmin - 1 + shift] = ahi + 1
+        else:
+            bmin += 1
+        if bmax < dmax:
+            bmax += 1
+            bd[bmax + 1 + shift] = ahi + 1
+        else:
+            bmax -= 1
+        for d in range(bmax, bmin - 1, -2):
+            low, high = bd[d - 1 + shift], bd[d + 1 + shift]
+            x = low if low < high else high - 1
+            y = x - d
+            while x > alo and y > blo and a[x - 1] == b[y - 1]:
+                x -= 1
+                y -= 1
+            bd[d + shift] = x
+            if not odd and fmin <= d <= fmax and x <= fd[d + shift]:
+                return x, y
+    forward = max((_clip(fd[d + shift], d, alo, ahi, blo, bhi) for d in range(fmin, fmax + 1, 2)), key=sum)
+    backward = min((_clip(bd[d + shift], d, alo, ahi, blo, bhi) for d in range(bmin, bmax + 1, 2)), key=sum)
+    return forward if sum(forward) - alo - blo >= ahi + bhi - sum(backward) else backward
+
+
+def _clip(x, d, alo, ahi, blo, bhi):
+    """Point of the diagonal d at x, moved back inside the compared ranges"""
+    x = min(max(x, alo), ahi)
+    x = min(max(x - d, blo), bhi) + d
+    return x, x - d
+
+
+def _match(a, alo, ahi, b, blo, bhi, blocks):
+    """Appends (i, j, size) matching blocks of a[alo:ahi] and b[blo:bhi] to blocks (in no particular order)"""
+    parts = [(alo, ahi, blo, bhi)]
+    while parts:
+        alo, ahi, blo, bhi = parts.pop()
+        prefix = _common_prefix(a, alo, ahi, b, blo, bhi)
+        if prefix:
+            blocks.append((alo, blo, prefix))
+            alo, blo = alo + prefix, blo + prefix
+        suffix = _common_suffix(a, alo, ahi, b, blo, bhi)
+        if suffix:
+            blocks.append((ahi - suffix, bhi - suffix, suffix))
+            ahi, bhi = ahi - suffix, bhi - suffix
+        if alo == ahi or blo == bhi:
+            continue
+        anchors = _anchors(a, alo, ahi, b, blo, bhi)
+        if not anchors:
+            x, y = _middle_split(a, alo, ahi, b, blo, bhi)
+            if (x, y) != (alo, blo) and (x, y) != (ahi, bhi):  # otherwise the part is left as replaced
+                parts += [(alo, x, blo, y), (x, ahi, y, bhi)]
+            continue
+        for i, j, size in anchors + [(ahi, bhi, 0)]:
+            if alo < i and blo < j:
+                parts.append((alo, i, blo, j))
+            if size:
+                blocks.append((i, j, size))
+            alo, blo = i + size, j + size
+
+
+def opcodes(seq1, seq2):
+    """Opcodes (with lines) transforming seq1 into seq2; both need to be lists of hashable elements"""
+    blocks = []
+    _match(seq1, 0, len(seq1), seq2, 0, len(seq2), blocks)
+    blocks.sort()
+    merged = []
+    for block in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == block[0] and merged[-1][1] + merged[-1][2] == block[1]:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + block[2])
+        else:
+            merged.append(block)
+    i = j = 0
+    for block_i, block_j, size in merged + [(len(seq1), len(seq2), 0)]:
+        tag = "replace" if i < block_i and j < block_j else "delete" if i < block_i else "insert" if j < block_j else None
+        if tag:
+            yield tag, i, block_i, j, block_j, seq1[i:block_i], seq2[j:block_j]
+        if size:
+            yield "equal", block_i, block_i + size, block_j, block_j + size, seq1[block_i:block_i + size], None
+        i, j = block_i + size, block_j + size
+
+
+def window_opcodes(seq1, seq2, window):
+    """
+    Opcodes of two streamed sequences, compared window lines at a time; everything up to the last match
+    of each window is final, and the rest is compared again with the next lines
+    Exact for mostly identical inputs; if no line of a window matches, the window is reported as replaced
+    """
+    iter1, iter2 = iter(seq1), iter(seq2)
+    a, b = [], []
+    a_offset = b_offset = 0
+    while True:
+        a.extend(islice(iter1, window - len(a)))
+        b.extend(islice(iter2, window - len(b)))
+        ended = len(a) < window and len(b) < window
+        ops = list(opcodes(a, b))
+        last_equal = max((index for index, op in enumerate(ops) if op[0] == "equal"), default=len(ops) - 1)
+        if ended:
+            last_equal = len(ops) - 1
+        for tag, i1, i2, j1, j2, lines1, lines2 in ops[:last_equal + 1]:
+            yield tag, i1 + a_offset, i2 + a_offset, j1 + b_offset, j2 + b_offset, lines1, lines2
+        if ended:
+            return
+        if last_equal >= 0:
+            _, _, i2, _, j2, _, _ = ops[last_equal]
+            del a[:i2]
+            del b[:j2]
+            a_offset, b_offset = a_offset + i2, b_offset + j2
+
+
+def hunks(ops, context):
+    """
+    Groups the opcodes into hunks of changes with (at most) context equal lines around them;
+    long equal runs (e.g. spanning many windows) are never kept in memory
+    """
+    hunk = None
+    run = None  # [i1, j1, count, first lines, last lines] of the current equal run
+    for op in ops:
+        tag, i1, i2, j1, j2, lines1, _ = op
+        if tag == "equal":
+            if run is None:
+                run = [i1, j1, 0, [], deque(maxlen=context)]
+            run[2] += i2 - i1
+            run[3].extend(lines1[:context - len(run[3])])
+            run[4].extend(lines1[-context:] if context else ())
+            continue
+        if run is not None:
+            start_i, start_j, size, first, last = run
+            if hunk is not None and size <= 2 * context:
+                lines = first + list(last)[len(last) - (size - len(first)):] if size > len(first) else first
+                hunk.append(("equal", start_i, start_i + size, start_j, start_j + size, lines, None))
+            else:
+                if hunk is not None:
+                    hunk.append(_equal_op(start_i, start_j, first))
+                    yield hunk
+                hunk = []
+                if last:
+                    hunk.append(_equal_op(start_i + size - len(last), start_j + size - len(last), list(last)))
+            run = None
+        if hunk is None:
+            hunk = []
+        hunk.append(op)
+    if hunk is not None:
+        if run is not None and run[3]:
+            hunk.append(_equal_op(run[0], run[1], run[3]))
+        yield hunk
+
+
+def _equal_op(i, j, lines):
+    return "equal", i, i + len(lines), j, j + len(lines), lines, None
+
+
+def normal_format(ops, start_num):
+    for tag, i1, i2, j1, j2, lines1, lines2 in ops:
+        if tag == "equal":
+            continue
+        op = {'insert': 'a', 'delete': 'd', 'replace': 'c'}[tag]
+        left = str(i1 + start_num - int(op == "a")) if i2 - 1 <= i1 else '{},{}'.format(
+            i1 + start_num, i2 - 1 + start_num)
+        right = str(j1 + start_num - int(op == "d")) if j2 - 1 <= j1 else '{},{}'.format(
+            j1 + start_num, j2 - 1 + start_num)
+        yield "{}{}{}".format(left, op, right)
+        yield from ("< " + line for line in lines1)
+        yield from ("> " + line for line in lines2)
+
+
+def _unified_range(start, stop):
+    length = stop - start
+    if length == 1:
+        return str(start + 1)
+    return "{},{}".format(start + 1 if length else start, length)
+
+
+def unified_format(ops, context, names):
+    for number, hunk in enumerate(hunks(ops, context)):
+        if names and not number:  # no header for identical inputs, like diff
+            yield "--- " + names[0]
+            yield "+++ " + names[1]
+        yield "@@ -{} +{} @@".format(_unified_range(hunk[0][1], hunk[-1][2]), _unified_range(hunk[0][3], hunk[-1][4]))
+        for tag, _, _, _, _, lines1, lines2 in hunk:
+            if tag == "equal":
+                yield from (" " + line for line in lines1)
+            else:
+                yield from ("-" + line for line in lines1)
+                yield from ("+" + line for line in lines2)
+
+
+def _context_range(start, stop):
+    length = stop - start
+    if length <= 1:
+        return str(start + length)
+    return "{},{}".format(start + 1, stop)
+
+
+def context_format(ops, context, names):
+    prefixes = {"equal": "  ", "replace": "! ", "delete": "- ", "insert": "+ "}
+    for number, hunk in enumerate(hunks(ops, context)):
+        if names and not number:
+            yield "*** " + names[0]
+            yield "--- " + names[1]
+        yield "***************"
+        yield "*** {} ****".format(_context_range(hunk[0][1], hunk[-1][2]))
+        if any(op[0] in ("replace", "delete") for op in hunk):
+            for tag, _, _, _, _, lines1, _ in hunk:
+                if tag != "insert":
+                    yield from (prefixes[tag] + line for line in lines1)
+        yield "--- {} ----".format(_context_range(hunk[0][3], hunk[-1][4]))
+        if any(op[0] in ("replace", "insert") for op in hunk):
+            for tag, _, _, _, _, lines1, lines2 in hunk:
+                if tag != "delete":
+                    yield from (prefixes[tag] + line for line in (lines1 if tag == "equal" else lines2))
@@ -1,7 +1,14 @@
 import bz2
+import gzip
+import locale
+import lzma
+import os
+import stat
 import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
-from .generator import make_drain
+from .generator import make_drain, iter_batches, _executor_map, DEFAULT_BATCH_SIZE
 
 
 @make_drain
@@ -10,29 +17,159 @@ def to_list(source):
 
 
 @make_drain
-def echo(source, out=sys.stdout):
-    """Prints the input stream to stdout"""
-    for line in source:
-        print(line, file=out)
+def echo(source, out=sys.stdout, batch_size=None):
+    """
+    Prints the input stream to stdout
+    The stream is pulled in batches of batch_size lines, each printed at once; by default lines are printed one by one
+    if out is a terminal (so that they appear as soon as they are generated) and in batches of DEFAULT_BATCH_SIZE lines
+    otherwise
+    """
+    if batch_size is None:
+        batch_size = 1 if _is_interactive(out) else DEFAULT_BATCH_SIZE
+    if batch_size > 1:
+        for batch in iter_batches(source, batch_size):
+            out.write("\n".join(map(str, batch)) + "\n")
+    else:
+        for line in source:
+            print(line, file=out)
+
+
+def _is_interactive(out):
+    try:
+        return out.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
+_FSYNC_POLICIES = (None, "close", "batch")
 
 
 @make_drain
-def to_file(source, filename, mode="w"):
+def to_file(source, filename, mode="w", batch_size=DEFAULT_BATCH_SIZE, buffer_size=2 ** 20, atomic=False, fsync=None,
+            encoding=None):
     """
     Saves the input stream to given file
     :param filename: what file to save the stream to
-    :param mode: either 'w' or 'a' - the meaning is the same as with open function
+    :param mode: 'w' or 'a' - the meaning is the same as with open function; with 'wb' or 'ab'
+        the elements need to be bytes and are written unchanged
+    :param batch_size: the stream is pulled in batches of that many lines and each batch is written at once
+    :param buffer_size: size of the buffer of the file
+    :param atomic: if True, the stream is written to a temporary file, which replaces the target file only after
+        the whole stream is written, so the file is never seen partially written (not possible with append mode)
+    :param fsync: None - leave flushing to disk to the operating system, "close" - flush it once, after the whole
+        stream is written (and, if atomic, the directory after the file is renamed), "batch" - after every batch
     :return: None
     """
-    with open(filename, mode) as outfile:
-        for line in source:
-            outfile.write("{}\n".format(line))
+    if fsync not in _FSYNC_POLICIES:
+        raise ValueError("fsync needs to be one of {}".format(_FSYNC_POLICIES))
+    if atomic and 'a' in mode:
+        raise ValueError("Atomic writing is not possible in append mode")
+    binary = 'b' in mode
+    target = filename
+    if atomic:
+        fd, filename = tempfile.mkstemp(prefix=".{}.".format(os.path.basename(filename)),
+                                        dir=os.path.dirname(os.path.abspath(filename)))
+        os.fchmod(fd, _new_file_permissions(target))
+        os.close(fd)
+    try:
+        with open(filename, mode, buffering=buffer_size, encoding=None if binary else encoding) as outfile:
+            for batch in iter_batches(source, batch_size or DEFAULT_BATCH_SIZE):
+                if binary:
+                    outfile.write(b"".join(batch))
+                else:
+                    outfile.write("\n".join(map(str, batch)) + "\n")
+                if fsync == "batch":
+                    outfile.flush()
+                    os.fsync(outfile.fileno())
+            if fsync == "close":
+                outfile.flush()
+                os.fsync(outfile.fileno())
+        if atomic:
+            os.replace(filename, target)
+            if fsync is not None:
+                _fsync_dir(os.path.dirname(os.path.abspath(target)))
+    except BaseException:
+        if atomic and os.path.exists(filename):
+            os.remove(filename)
+        raise
+
+
+def _new_file_permissions(filename):
+    """Permissions of the file, if it exists, otherwise of a new file created by open"""
+    try:
+        return stat.S_IMODE(os.stat(filename).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def _fsync_dir(dirname):
+    fd = os.open(dirname, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# format: (compress function, open function, default block size), both functions taking data/filename, mode and level
+_COMPRESSORS = {
+    "bz2": (lambda data, level: bz2.compress(data, level),
+            lambda filename, mode, level: bz2.open(filename, mode, compresslevel=level), 900 * 1000),
+    "gz": (lambda data, level: gzip.compress(data, level),
+           lambda filename, mode, level: gzip.open(filename, mode, compresslevel=level), 2 ** 20),
+    "xz": (lambda data, level: lzma.compress(data, preset=level),
+           lambda filename, mode, level: lzma.open(filename, mode, preset=level), 4 * 2 ** 20),
+}
+
+
+def _blocks(source, text, block_size, encoding):
+    """Joins the elements (lines of text or bytes) into blocks of at least block_size bytes"""
+    parts, size = [], 0
+    for batch in iter_batches(source, DEFAULT_BATCH_SIZE):
+        data = ("\n".join(map(str, batch)) + "\n").encode(encoding) if text else b"".join(batch)
+        parts.append(data)
+        size += len(data)
+        if size >= block_size:
+            yield b"".join(parts)
+            parts, size = [], 0
+    if parts:
+        yield b"".join(parts)
+
+
+def _compress_to_file(source, fmt, filename, mode, workers, level, block_size, encoding):
+    compress, open_, default_block_size = _COMPRESSORS[fmt]
+    blocks = _blocks(source, 't' in mode, block_size or default_block_size,
+                     encoding or locale.getpreferredencoding(False))
+    mode = mode.replace('t', '').replace('b', '') + 'b'
+    if workers is None or workers <= 1:
+        with open_(filename, mode, level) as outfile:
+            for block in blocks:
+                outfile.write(block)
+        return
+    with open(filename, mode) as outfile, ThreadPoolExecutor(workers) as executor:
+        for compressed in _executor_map(executor, compress, blocks, 2 * workers, level):
+            outfile.write(compressed)
 
 
 @make_drain
-def to_bz2(source, filename, mode='wt'):
-    if 't' in mode:
-        source = (line + '\n' for line in source)
-    with bz2.open(filename, mode) as outfile:
-        for line in source:
-            outfile.write(line)
+def to_bz2(source, filename, mode='wt', workers=None, level=9, block_size=None, encoding=None):
+    """
+    Saves the input stream (lines of text or, with binary mode, bytes) to bz2 file
+    With workers > 1 the stream is split into blocks of block_size bytes (by default 900kB, bzip2 block size
+    for level 9), which are compressed concurrently by that many threads and written as consecutive streams,
+    which standard tools decompress as a single file (like pbzip2)
+    """
+    _compress_to_file(source, "bz2", filename, mode, workers, level, block_size, encoding)
+
+
+@make_drain
+def to_gz(source, filename, mode='wt', workers=None, level=6, block_size=None, encoding=None):
+    """Saves the input stream to gzip file; with workers > 1 compresses blocks (by default 1MB) in parallel, as to_bz2"""
+    _compress_to_file(source, "gz", filename, mode, workers, level, block_size, encoding)
+
+
+@make_drain
+def to_xz(source, filename, mode='wt', workers=None, level=6, block_size=None, encoding=None):
+    """Saves the input stream to xz file; with workers > 1 compresses blocks (by default 4MB) in parallel, as to_bz2"""
+    _compress_to_file(source, "xz", filename, mode, workers, level, block_size, encoding)
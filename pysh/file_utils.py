@@ -1,12 +1,15 @@
+import hashlib
 import os
-import re
 import shutil
+import stat
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 
 import psutil
 
 from .generator import make_source, make_pipe
-from .main import Flags, NO_FLAGS
+from .main import Flags, NO_FLAGS, diff, _BINARY_CHECK_SIZE
+from .regex_engine import compile_regex
 
 _working_dir = os.path.abspath(os.path.curdir)
 _prev_working_dir = _working_dir
@@ -181,7 +184,7 @@ def find(path, name="", file_type=None, skip_hidden=False):
     @make_pipe
     def filter_name(source, pattern):
         if 'match' not in dir(pattern):
-            pattern = re.compile(pattern)
+            pattern = compile_regex(pattern)
         yield from (fname for fname in source if pattern.match(os.path.split(fname)[-1]))
 
     @make_pipe
@@ -208,6 +211,114 @@ def find(path, name="", file_type=None, skip_hidden=False):
     return result
 
 
+_HASH_CHUNK_SIZE = 2 ** 20
+
+
+@make_source
+def diff_tree(dir1, dir2, shallow=True, workers=8, line_diffs=None):
+    """
+    Compares two directory trees, like diff -r, generating (status, path) tuples for files (and directories)
+    that are "added" (only in dir2), "removed" (only in dir1) or "changed"; paths are relative to the compared
+    directories; contents of added and removed directories are not listed, only the directories themselves
+    Both trees are walked at once and files of different sizes are changed without reading them; the others are
+    hashed in a pool of threads, so the order of the changed files is not specified
+    Params:
+    shallow - files with the same size and modification time are considered equal without reading them
+        (like filecmp.cmp does)
+    workers - number of threads hashing the files
+    line_diffs - if given ("normal", "unified" or "context"), tuples have third element: for changed text files
+        the lazily computed line diff in that format, otherwise None
+    """
+    dir1, dir2 = _to_absolute(dir1), _to_absolute(dir2)
+    for path in (dir1, dir2):
+        if not path.is_dir():
+            raise NotADirectoryError("'{}' is not a directory.".format(path))
+
+    def result(status, path, regular):
+        if line_diffs is None:
+            return status, path
+        lines = None
+        if status == "changed" and regular and _is_text(dir1 / path) and _is_text(dir2 / path):
+            lines = _line_diff(dir1 / path, dir2 / path, path, line_diffs)
+        return status, path, lines
+
+    with ThreadPoolExecutor(workers) as executor:
+        pending = set()
+        for status, path, regular in _walk_trees(dir1, dir2, shallow):
+            if status is not None:
+                yield result(status, path, regular)
+                continue
+            pending.add(executor.submit(_same_content, dir1 / path, dir2 / path, path))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from (result("changed", future.result()[1], True) for future in done if not future.result()[0])
+        for future in pending:
+            same, path = future.result()
+            if not same:
+                yield result("changed", path, True)
+
+
+def _walk_trees(dir1, dir2, shallow):
+    """
+    Walks both trees at once (with scandir, sorted by name), generating (status, relative path, regular) for
+    differences found from the directory entries and stats, and (None, relative path, True) for files which need
+    to be read; regular tells if the path is a regular file in both trees (not a directory, symlink etc.)
+    """
+    stack = [""]
+    while stack:
+        subdir = stack.pop()
+        with os.scandir(dir1 / subdir) as entries:
+            entries1 = {entry.name: entry for entry in entries}
+        with os.scandir(dir2 / subdir) as entries:
+            entries2 = {entry.name: entry for entry in entries}
+        subdirs = []
+        for name in sorted(entries1.keys() | entries2.keys()):
+            path = os.path.join(subdir, name)
+            if name not in entries2:
+                yield "removed", path, False
+            elif name not in entries1:
+                yield "added", path, False
+            else:
+                entry1, entry2 = entries1[name], entries2[name]
+                stat1, stat2 = entry1.stat(follow_symlinks=False), entry2.stat(follow_symlinks=False)
+                regular = stat.S_ISREG(stat1.st_mode) and stat.S_ISREG(stat2.st_mode)
+                if stat.S_IFMT(stat1.st_mode) != stat.S_IFMT(stat2.st_mode):
+                    yield "changed", path, False
+                elif entry1.is_symlink():
+                    if os.readlink(entry1.path) != os.readlink(entry2.path):
+                        yield "changed", path, False
+                elif entry1.is_dir(follow_symlinks=False):
+                    subdirs.append(path)
+                elif stat1.st_size != stat2.st_size:
+                    yield "changed", path, regular
+                elif not (shallow and stat1.st_mtime_ns == stat2.st_mtime_ns) and stat1.st_size:
+                    yield None, path, True  # only regular files have sizes
+        stack.extend(reversed(subdirs))
+
+
+def _same_content(filename1, filename2, path):
+    return _file_digest(filename1) == _file_digest(filename2), path
+
+
+def _file_digest(filename):
+    digest = hashlib.blake2b()
+    with open(filename, "rb") as infile:
+        for chunk in iter(lambda: infile.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _is_text(filename):
+    with open(filename, "rb") as infile:
+        return b"\0" not in infile.read(_BINARY_CHECK_SIZE)
+
+
+def _line_diff(filename1, filename2, path, output):
+    from .sources import cat  # sources imports this module
+    yield from diff(cat(str(filename1)), cat(str(filename2)), start_num=1, output=output,
+                    names=(os.path.join("a", path), os.path.join("b", path)))
+
+
 def _to_path(path):
     """Returns Path object for given path, optionally expanding tilde"""
     if str(path).startswith("~"):  # in case path is Path
@@ -225,11 +336,11 @@ def _to_absolute(path):
                                  path)).absolute()  # could simply return Path(path).absolute, but it doesn't work with cd
 
 
-VAR_RE = re.compile(r'(\$(?:\w+|{\w+}))')
+VAR_RE = r'(\$(?:\w+|{\w+}))'
 
 
 def _expand_env_vars(s):
-    env_vars = set(VAR_RE.findall(s))
+    env_vars = set(compile_regex(VAR_RE).findall(s))
     env_vars = {varname: os.environ.get(varname.strip('${}'), '') for varname in sorted(env_vars, key=len, reverse=True)}
     for varname, value in env_vars.items():
         s = s.replace(varname, value)
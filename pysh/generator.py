@@ -1,4 +1,11 @@
+import os
+import signal
 import subprocess
+from collections import deque
+from concurrent.futures import wait, as_completed, FIRST_COMPLETED
+from inspect import getgeneratorstate, GEN_CREATED
+from itertools import islice
+from threading import Thread
 
 from tqdm import tqdm
 
@@ -6,6 +13,9 @@ from tqdm import tqdm
 
 _generator_class = type((i for i in []))
 
+DEFAULT_BATCH_SIZE = 4096
+FUSE_PIPES = True  # whether consecutive ElementwisePipes are fused into a single pipe element
+
 
 class PipeElement:
     pass  # marker class
@@ -26,7 +36,9 @@ class Generator(PipeElement):
     """
 
     def __init__(self, gen=None):
-        if "__next__" in dir(gen):
+        if gen is None:
+            self._gen = self.gen()
+        elif "__next__" in dir(gen):
             self._gen = gen
         elif "__iter__" in dir(gen):
             self._gen = iter(gen)
@@ -74,6 +86,30 @@ class Generator(PipeElement):
     def __radd__(self, other):
         return GeneratorConcat(other, self)
 
+    def batches(self, size=DEFAULT_BATCH_SIZE):
+        """
+        Generates the content as lists of (at most) size elements
+        Pipe elements that can process whole batches at once override it; by default elements are just grouped
+        """
+        if type(self).__next__ is Generator.__next__:
+            return _chunked(self._gen, size)  # skips calling __next__ for every element
+        return _chunked(self, size)
+
+
+def _chunked(iterator, size):
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_batches(source, size=DEFAULT_BATCH_SIZE):
+    """Iterates over source in lists of elements, using its native batch implementation if it has one"""
+    if isinstance(source, Generator):
+        return source.batches(size)
+    return _chunked(iter(source), size)
+
 
 class KnownLengthGenerator(Generator):
     # cat, cat_list, bz2_cat - cat i bz2_cat kosztowne, więc albo na prośbę użytkownika, albo wg rozmaru pliku w bajtach
@@ -99,6 +135,42 @@ class KnownLengthGenerator(Generator):
             return self.__len
 
 
+class RandomAccessGenerator(Generator):
+    """
+    Generator over elements which can be accessed directly by their index, e.g. lines of an indexed file;
+    supports indexing, slicing (seq[i:j] is a Generator) and reversed(seq)
+    Subclasses implement __len__ and element(index) and update position (index of the next element to generate)
+    if they override gen; head and tail use it to skip directly to the elements they need
+    """
+
+    def __init__(self):
+        super().__init__(None)
+        self.position = 0
+
+    def __len__(self):
+        raise NotImplementedError()
+
+    def element(self, index):
+        raise NotImplementedError()
+
+    def gen(self):
+        while self.position < len(self):
+            self.position += 1
+            yield self.element(self.position - 1)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return generator(self.element(i) for i in range(*item.indices(len(self))))
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("index out of range")
+        return self.element(item)
+
+    def __reversed__(self):
+        return generator(self.element(i) for i in range(len(self) - 1, -1, -1))
+
+
 class GeneratorConcat(Generator):
     """Concatenation of generators - generates all data from the first one, then from the second and so on"""
 
@@ -190,7 +262,7 @@ def make_source(func=None, len_=None):
                     self.kwargs = kwargs
 
                 def gen(self):
-                    yield from (elem for elem in func(*self.args, **self.kwargs))
+                    yield from func(*self.args, **self.kwargs)
 
                 # __len__ is defined in KnownLengthGenerator
 
@@ -217,19 +289,162 @@ def make_drain(f):
     return drain
 
 
+class ElementwisePipe(Generator):
+    """
+    Base class for pipe elements transforming every element independently of the others
+    or, if filters is True, retaining only the elements for which the function returns true value
+    Subclasses implement element_func method, returning the function called for every element,
+    which allows them to process whole batches of elements at once
+    """
+    filters = False
+
+    def __init__(self):
+        super().__init__(None)
+
+    def element_func(self):
+        raise NotImplementedError()
+
+    def gen(self):
+        if self.filters:
+            yield from filter(self.element_func(), self.source)
+        else:
+            yield from map(self.element_func(), self.source)
+
+    def batches(self, size=DEFAULT_BATCH_SIZE):
+        func = self.element_func()
+        for batch in iter_batches(self.source, size):
+            if self.filters:
+                batch = list(filter(func, batch))
+                if batch:
+                    yield batch
+            else:
+                yield list(map(func, batch))
+
+    def fusable(self):
+        """Whether the element can be fused with neighbouring ones; elements overriding gen should return False"""
+        return True
+
+    def steps(self):
+        """List of (filters, function) pairs, applied one after another to every element"""
+        return [(self.filters, self.element_func())]
+
+    def __ror__(self, other):
+        if (FUSE_PIPES and isinstance(other, ElementwisePipe) and other.fusable() and self.fusable()
+                and other.source is not None and getgeneratorstate(other._gen) == GEN_CREATED):
+            return FusedPipe(other.steps() + self.steps()).__ror__(other.source)
+        return super().__ror__(other)
+
+
+class FusedPipe(ElementwisePipe):
+    """
+    Chain of ElementwisePipes fused into a single pipe element: the functions are applied by nested built-in
+    map and filter iterators inside one generator, instead of a generator (and a frame switch) per pipe element
+    Created automatically when such elements are piped one after another (unless FUSE_PIPES is False)
+    """
+
+    def __init__(self, steps):
+        super().__init__()
+        self._steps = steps
+
+    def steps(self):
+        return self._steps
+
+    def _apply(self, iterable):
+        for filters, func in self._steps:
+            iterable = filter(func, iterable) if filters else map(func, iterable)
+        return iterable
+
+    def gen(self):
+        yield from self._apply(self.source)
+
+    def batches(self, size=DEFAULT_BATCH_SIZE):
+        for batch in iter_batches(self.source, size):
+            batch = list(self._apply(batch))
+            if batch:
+                yield batch
+
+
 def pipe_from_func(func, *args_o, **kwargs_o):
     """
     Turns any given function to pipe, calling it for every element of source sequence
     """
 
-    @make_pipe
-    def inner(source, *args, **kwargs):
-        for elem in source:
-            yield func(elem, *args, *args_o, **kwargs, **kwargs_o)
+    class inner(ElementwisePipe):
+
+        def __init__(self, *args, **kwargs):
+            super().__init__()
+            self.args = args
+            self.kwargs = kwargs
+
+        def element_func(self):
+            args, kwargs = self.args, self.kwargs
+            if not (args or kwargs or args_o or kwargs_o):
+                return func
+            return lambda elem: func(elem, *args, *args_o, **kwargs, **kwargs_o)
 
     return inner
 
 
+class batched(Generator):
+    """
+    Groups the elements of the input sequence into lists of (at most) size elements
+    If preceding pipe elements support batches natively, whole batches are passed between them
+    """
+
+    def __init__(self, size=DEFAULT_BATCH_SIZE):
+        super().__init__(None)
+        self.size = size
+
+    def gen(self):
+        yield from iter_batches(self.source, self.size)
+
+
+class unbatched(Generator):
+    """Flattens the sequence of lists (e.g. made by batched) back into the sequence of elements"""
+
+    def __init__(self):
+        super().__init__(None)
+
+    def gen(self):
+        for batch in self.source:
+            yield from batch
+
+    def batches(self, size=DEFAULT_BATCH_SIZE):
+        return (batch for batch in self.source if batch)  # the lists are passed as they are, regardless of size
+
+
+def _executor_map(executor, func, iterable, max_pending, *args, ordered=True):
+    """
+    Like executor.map, but submits new tasks lazily, keeping at most max_pending of them in flight,
+    so that arbitrarily long (or infinite) iterables can be processed in constant memory
+    If ordered is False, the results are generated in the order of completion instead of the order of input
+    """
+    pending = deque() if ordered else set()
+    try:
+        for elem in iterable:
+            if ordered:
+                pending.append(executor.submit(func, elem, *args))
+            else:
+                pending.add(executor.submit(func, elem, *args))
+            if len(pending) >= max_pending:
+                if ordered:
+                    yield pending.popleft().result()
+                else:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+        if ordered:
+            while pending:
+                yield pending.popleft().result()
+        else:
+            for future in as_completed(pending):
+                pending.discard(future)
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
 class tqdm_wrapper(tqdm):
 
     def __iter__(self):
@@ -278,6 +493,57 @@ def run_command(command, raise_on_error=True):
         return output, error, result.returncode
 
 
+def _strip_newline(line):
+    """Strips \\n or \\r\\n ending the line read with newline="\\n" (so that lone \\r doesn't split lines)"""
+    if line.endswith("\n"):
+        return line[:-2] if line.endswith("\r\n") else line[:-1]
+    return line
+
+
+class _TailReader:
+    """
+    Reads a binary stream to its end in a background thread, retaining only its last limit bytes, and closes it
+    The file descriptor is read directly, so that the stream's lock isn't held while waiting for data - otherwise
+    closing the stream at interpreter shutdown (e.g. when a generator stopped by head is finalized) would abort
+    """
+
+    def __init__(self, stream, limit):
+        self._data = bytearray()
+        self._thread = Thread(target=self._read, args=(stream, limit), name="pysh-stderr", daemon=True)
+        self._thread.start()
+
+    def _read(self, stream, limit):
+        fd = stream.fileno()
+        try:
+            while True:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    return
+                self._data += chunk
+                del self._data[:-limit]
+        finally:
+            stream.close()
+
+    def result(self, encoding="utf-8"):
+        """Waits until the stream ends and returns its tail"""
+        self._thread.join()
+        return self._data.decode(encoding, errors="replace")
+
+
+def _kill_command(process):
+    """
+    Kills the process of a command started with start_new_session=True, together with all the processes it started
+    (the shell may run the command in a child process instead of replacing itself with it)
+    """
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass  # already finished
+    else:
+        process.kill()
+
+
 def _start_application(command):
     """Starts any application. Designed for GUI applications."""
     subprocess.Popen(command, shell=True)
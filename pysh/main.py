@@ -1,11 +1,26 @@
+import heapq
+import io
+import mmap
+import os
+import pickle
 import re
-from collections import deque
-from difflib import SequenceMatcher
+import subprocess
+import sys
+import tempfile
+from collections import Counter, deque, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from enum import Flag, auto
+from functools import lru_cache, partial
+from itertools import chain, count
 from operator import itemgetter
+from threading import Thread
 from warnings import warn
 
-from .generator import Generator, PipeElement, make_pipe, pipe_from_func
+from . import diff_engine
+from .regex_engine import compile_regex, is_compiled, engine_of, releases_gil, ERRORS
+from .generator import (Generator, PipeElement, ElementwisePipe, RandomAccessGenerator, make_pipe, pipe_from_func,
+                        _executor_map,
+                        DEFAULT_BATCH_SIZE, iter_batches, CommandError, _TailReader, _kill_command, _strip_newline)
 
 
 class Flags(Flag):
@@ -26,18 +41,192 @@ NO_FLAGS = Flags.W & Flags.L
 rev = pipe_from_func(lambda s: s[::-1])
 
 
-class grep(Generator):
+def _trie_regex(literals):
+    """Regular expression matching any of the literals, with common prefixes merged, so that it scales to many of them"""
+    trie = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[""] = {}  # end of a literal
+    return _trie_node_regex(trie) if trie else "(?!)"
+
+
+def _trie_node_regex(node):
+    if "" in node:
+        return ""  # a literal ends here, there's no need to match longer ones containing it
+    alternatives = []
+    for char, child in sorted(node.items()):
+        prefix = [char]
+        while len(child) == 1 and "" not in child:
+            (char, child), = child.items()
+            prefix.append(char)
+        alternatives.append(re.escape("".join(prefix)) + _trie_node_regex(child))
+    return alternatives[0] if len(alternatives) == 1 else "(?:{})".format("|".join(alternatives))
+
+
+_MIN_NGRAM = 4  # fixed strings shorter than that are matched with a regex
+
+
+class _Literals:
+    """
+    Matcher for a large number of fixed strings: substrings of the text as long as the shortest of them are looked up
+    in the set of their prefixes and only candidates found this way are searched for; very short strings are matched
+    with a single regex
+    """
+
+    def __init__(self, literals, ignore_case=False):
+        self.ignore_case = ignore_case
+        literals = {literal.casefold() if ignore_case else literal for literal in literals}
+        short = [literal for literal in literals if len(literal) < _MIN_NGRAM]
+        self.short = compile_regex(_trie_regex(short)).search if short else None
+        self.width = min((len(literal) for literal in literals if len(literal) >= _MIN_NGRAM), default=0)
+        self.by_prefix = defaultdict(list)
+        for literal in literals:
+            if len(literal) >= _MIN_NGRAM:
+                self.by_prefix[literal[:self.width]].append(literal)
+        self.prefixes = frozenset(self.by_prefix)
+
+    def search(self, text):
+        if self.ignore_case:
+            text = text.casefold()
+        if self.short is not None and self.short(text):
+            return True
+        width = self.width
+        candidates = self.prefixes.intersection({text[i:i + width] for i in range(len(text) - width + 1)})
+        return any(literal in text for prefix in candidates for literal in self.by_prefix[prefix])
+
+
+_BINARY_CHECK_SIZE = 8192  # files with NUL byte in that many first bytes are considered binary and skipped
+_MMAP_MIN_SIZE = 2 ** 20  # smaller files are read instead of memory mapped
+
+
+_SEARCH_BLOCK_SIZE = 2 ** 20  # blocks of the buffer prefiltered with bytes regex (if they are plain ASCII)
+
+
+def _buffer_regex(pattern):
+    """
+    Compiled str regex converted to bytes regex finding (a superset of) matching lines in ASCII buffer without \\r,
+    or None if that's not possible (non-ASCII patterns, or ones that depend on where the string ends - \\A, \\Z
+    and lookarounds)
+    """
+    if not is_compiled(pattern) or not isinstance(pattern.pattern, str) or not pattern.pattern.isascii():
+        return None
+    if any(token in pattern.pattern for token in ("\\A", "\\Z", "(?=", "(?!", "(?<")):
+        return None
+    try:
+        return compile_regex(pattern.pattern.encode(), (pattern.flags & ~re.UNICODE) | re.MULTILINE, engine_of(pattern))
+    except ERRORS:  # e.g. \u escapes, which are not supported in bytes patterns
+        return None
+
+
+def _split_lines(data):
+    """Decoded lines of the buffer, without newline characters (\\n or \\r\\n)"""
+    lines = data[:].decode("utf-8", errors="replace").split("\n")
+    if not lines[-1]:
+        lines.pop()  # the buffer ends with newline
+    return [line[:-1] if line.endswith("\r") else line for line in lines]
+
+
+def _search_lines(lines, matcher, invert, line_num, result):
+    search = matcher.search
+    result.extend((num, line) for num, line in enumerate(lines, line_num) if bool(search(line)) != invert)
+    return line_num + len(lines)
+
+
+def _search_block(block, prefilter, matcher, invert, line_num, result):
+    """
+    Searches ASCII block (without \\r) with bytes prefilter, checking only the lines it finds with matcher;
+    appends (line number, line) pairs of matching (or, if invert is True, not matching) lines to result
+    and returns the number of the line following the block
+    """
+    search = partial(prefilter.search, concurrent=True) if releases_gil(prefilter) else prefilter.search
+    pos = 0
+    while pos < len(block):
+        match = search(block, pos)
+        if match is None or match.start() == len(block) and block.endswith(b"\n"):
+            break  # (empty) match after the last newline is not in any line
+        start = block.rfind(b"\n", 0, match.start()) + 1
+        end = block.find(b"\n", match.start())
+        if end == -1:
+            end = len(block)
+        if invert:
+            line_num = _search_lines(block[pos:start].decode("ascii").split("\n")[:-1], matcher, invert, line_num, result)
+        else:
+            line_num += block.count(b"\n", pos, start)
+        line = block[start:end].decode("ascii")
+        if bool(matcher.search(line)) != invert:
+            result.append((line_num, line))
+        line_num += 1
+        pos = end + 1
+    if pos < len(block):
+        rest = _split_lines(block[pos:])
+        if invert:
+            return _search_lines(rest, matcher, invert, line_num, result)
+        line_num += len(rest)
+    return line_num
+
+
+def _search_file(filename, matcher, prefilter=None, invert=False):
+    """
+    Searches the file (memory mapped, if it is large) for lines matching matcher (object with search method called
+    for decoded lines); if prefilter (bytes regex) is given, it is first run over whole blocks of plain ASCII text,
+    so that only the lines it finds are decoded and checked; returns (line number, line) pairs
+    """
+    with open(filename, "rb", buffering=0) as infile:
+        size = os.fstat(infile.fileno()).st_size
+        if size < _MMAP_MIN_SIZE:  # for small files mapping costs more than reading
+            return _search_data(infile.read(), matcher, prefilter, invert)
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _search_data(data, matcher, prefilter, invert)
+
+
+def _search_data(data, matcher, prefilter, invert):
+    result = []
+    if data.find(b"\0", 0, _BINARY_CHECK_SIZE) != -1:
+        return result
+    if prefilter is None:
+        _search_lines(_split_lines(data), matcher, invert, 0, result)
+        return result
+    line_num, start = 0, 0
+    while start < len(data):
+        end = data.find(b"\n", start + _SEARCH_BLOCK_SIZE)
+        end = len(data) if end == -1 else end + 1
+        block = data[start:end]
+        if not block.isascii() or b"\r" in block:
+            line_num = _search_lines(_split_lines(block), matcher, invert, line_num, result)
+        else:
+            line_num = _search_block(block, prefilter, matcher, invert, line_num, result)
+        start = end
+    return result
+
+
+def _search_file_chunk(filenames, matcher, prefilter, invert):
+    return [(filename, _search_file(filename, matcher, prefilter, invert)) for filename in filenames]
+
+
+class grep(ElementwisePipe):
     """
     Filters input sequence, retaining only elements matching given expression.
     Params:
-    re - expression to be searched for; if it is string it is searched for literally;
-        if it is compiled regex it is searched for using the search method
+    pattern - expression to be searched for; it can be a string, compiled regex (searched for using the search method)
+        or a list of strings - then elements matching any of them are retained
     start_num - if flag N is specified, this argument allows to change the numbering from zero-based (default) to any other
+    patterns_file - file with additional patterns, one per line
+    files - file (or list of files) to be searched instead of the input sequence; large files are memory mapped,
+        and for most regular expressions blocks of plain ASCII text are first searched as a whole with bytes regex,
+        so only the lines it finds are decoded and checked (the results are the same as for the lines of cat(file));
+        binary files are skipped; for multiple files (or recursive search) filename is prepended to every result
+    recursive - if True, directories in files are searched recursively
+    workers - number of processes (or threads, with regex engine releasing GIL) searching files in parallel;
+        by default number of processors
     Flags:
+    F - patterns are fixed strings, searched for literally (even thousands of them are matched efficiently)
     I - ignore case
     V - retain only NOT matching elements
     N - prepend numbers
     """
+    filters = True
 
     @Generator.source.setter
     def source(self, val):
@@ -47,34 +236,104 @@ class grep(Generator):
         except TypeError:
             self.__len = None
 
-    def __init__(self, pattern, flags=NO_FLAGS, start_num=0):
-        super().__init__(None)
+    def __init__(self, pattern=None, flags=NO_FLAGS, start_num=0, patterns_file=None, files=None, recursive=False,
+                 workers=None):
+        super().__init__()
+        if isinstance(files, (str, os.PathLike)):
+            files = [files]
+        self.files = files
+        self.recursive = recursive
+        self.workers = workers
         self.re = pattern
+        self.literal = None
         self.start_num = start_num
         self.flags = flags
-        if 'search' not in dir(self.re):
-            self.re = re.compile(self.re)
-        if Flags.I in flags:
-            self.re = re.compile(self.re.pattern, self.re.flags | re.IGNORECASE)
+        if patterns_file is not None or isinstance(pattern, (list, tuple, set)):
+            patterns = [pattern] if isinstance(pattern, str) else list(pattern or [])
+            if patterns_file is not None:
+                with open(patterns_file) as infile:
+                    patterns.extend(infile.read().splitlines())
+            if Flags.F in flags:
+                self.re = _Literals(patterns, Flags.I in flags)
+            else:
+                self.re = compile_regex("|".join("(?:{})".format(p) for p in patterns) if patterns else "(?!)")
+        elif Flags.F in flags and not hasattr(self.re, "search"):
+            self.literal = self.re.casefold() if Flags.I in flags else self.re
+            self.re = re.escape(self.re)
+        if not hasattr(self.re, "search"):
+            self.re = compile_regex(self.re)
+        if Flags.I in flags and is_compiled(self.re):
+            self.re = compile_regex(self.re, re.IGNORECASE)
         self.__len = None
         self.__skipped = 0
 
+    def element_func(self):
+        literal = self.literal
+        if literal is None:
+            search = self.re.search
+        elif Flags.I in self.flags:
+            search = lambda x: literal in x.casefold()
+        else:
+            search = lambda x: literal in x
+        return search if Flags.V not in self.flags else (lambda x: not search(x))
+
     def gen(self):
+        if self.files is not None:
+            yield from self._search_files()
+            return
+        if Flags.N not in self.flags:
+            yield from super().gen()
+            return
         try:
             self.__len = len(self.source)
         except TypeError:
             pass  # ignore sources without len - just don't provide len
-        match = (lambda x: self.re.search(x)) if Flags.V not in self.flags else (lambda x: not self.re.search(x))
-        if Flags.N in self.flags:
-            self.source = enumerate(self.source, start=self.start_num)
-            _match = match
-            match = lambda el: _match(el[1])
+        _match = self.element_func()
+        match = lambda el: _match(el[1])
+        self.source = enumerate(self.source, start=self.start_num)
         for x in self.source:
             if match(x):
                 yield x
             elif self.__len is not None:
                 self.__len -= 1
 
+    def _search_files(self):
+        from .file_utils import find, _to_absolute  # file_utils imports this module
+        filenames = chain.from_iterable(
+            find(path, file_type="file") if self.recursive and os.path.isdir(path) else [str(path)]
+            for path in map(_to_absolute, self.files))
+        matcher, prefilter = self.re, _buffer_regex(self.re)
+        invert = Flags.V in self.flags
+        workers = self.workers or os.cpu_count() or 1
+        if workers == 1:
+            yield from self._format_results((filename, _search_file(filename, matcher, prefilter, invert))
+                                            for filename in filenames)
+        else:
+            # with GIL released during matching threads are enough, otherwise processes are needed
+            pool = ThreadPoolExecutor if prefilter is not None and releases_gil(prefilter) else ProcessPoolExecutor
+            with pool(workers) as executor:
+                yield from self._format_results(chain.from_iterable(_executor_map(
+                    executor, _search_file_chunk, iter_batches(filenames, 64), 2 * workers,
+                    matcher, prefilter, invert)))
+
+    def _format_results(self, results):
+        with_names = self.recursive or len(self.files) > 1
+        numbered = Flags.N in self.flags
+        for filename, lines in results:
+            for num, line in lines:
+                if with_names:
+                    yield (filename, num + self.start_num, line) if numbered else (filename, line)
+                else:
+                    yield (num + self.start_num, line) if numbered else line
+
+    def batches(self, size=DEFAULT_BATCH_SIZE):
+        if Flags.N in self.flags or self.files is not None:
+            return Generator.batches(self, size)  # numbering needs to go element by element
+        return super().batches(size)
+
+    def fusable(self):
+        return Flags.N not in self.flags and self.files is None
+
     # def __len__(self):
     #     if self.__len is not None:
     #         return self.__len
@@ -87,6 +346,8 @@ class uniq(Generator):
     Filter out repeted elements in input sequence
     Flags:
     C - append the number each element appered in sequence (counting consecutive occurences)
+    G - filter out all repeated elements, not only consecutive ones, like dedup(); with C the number of all
+        the occurences is appended, so the whole input is counted (in memory) before anything is generated
     """
 
     def __init__(self, flags=NO_FLAGS):
@@ -95,7 +356,15 @@ class uniq(Generator):
         self.flags = flags
 
     def gen(self):
-        if Flags.C in self.flags:
+        if Flags.G in self.flags and Flags.C in self.flags:
+            counts = Counter()  # keeps the order of the first occurences
+            for batch in iter_batches(self.source, DEFAULT_BATCH_SIZE):
+                counts.update(batch)
+            yield from counts.items()
+        elif Flags.G in self.flags:
+            from .aggregate import dedup  # aggregate imports this module
+            yield from self.source | dedup()
+        elif Flags.C in self.flags:
             yield from self._with_count()
         else:
             yield from self._normal()
@@ -131,12 +400,33 @@ class sort(Generator):
     G - sort according to numerical value of (prefix of) the string
     H - as G, but also support suffixes like K for kilo, M for mega etc.
     R - reverse ordering
+    Params:
+    max_memory - approximate number of bytes of input held in memory at once; if the input is bigger,
+        it is sorted in runs which are spilled to temporary files and lazily merged (like GNU sort -S)
+    workers - number of processes computing keys and sorting chunks of the input in parallel;
+        pays off mostly for G and H flags, as the chunks need to be sent to the worker processes and back;
+        with max_memory up to that many runs are sorted at the same time, so the memory budget is multiplied
+    keys - GNU-style key definition (as in sort -k) or list of them, e.g. "2,2" or ["3,3nr", "1"];
+        each one is POS1[,POS2][OPTS], where POS1 and POS2 are (one-based) numbers of the first and the last field
+        of the key (if POS2 is omitted the key extends to the end of the line), and OPTS are any of:
+        n or g - numeric value (as flag G), h - human readable value (as flag H), r - reverse ordering of this key;
+        keys without OPTS use the G, H and R flags given to sort; the keys of every line are computed only once
+        and the sort is stable - lines with equal keys retain their input order
+    delimiter - string separating the fields for keys; by default any whitespace
     """
 
-    def __init__(self, flags=NO_FLAGS):
+    _PARALLEL_MIN_LEN = 10000  # shorter inputs are sorted in the current process
+
+    def __init__(self, flags=NO_FLAGS, max_memory=None, workers=None, keys=None, delimiter=None):
         super().__init__(None)
         self.content = None
         self.flags = flags
+        self.max_memory = max_memory
+        self.workers = workers
+        if type(keys) in (str, int):
+            keys = [keys]
+        self.keys = keys
+        self.delimiter = delimiter
 
     @staticmethod
     def _general_numeric(elem):
@@ -157,20 +447,171 @@ class sort(Generator):
             val *= MULTIPLIERS[elem[i]]
         return val
 
-    def gen(self):
-        if Flags.G in self.flags:
-            key = sort._general_numeric
+    def _key(self):
+        """Returns key function (or None for sorting whole lines) and whether to reverse the ordering"""
+        if self.keys:
+            key = _FieldKey(self.keys, self.delimiter, self.flags)
+            return key, key.reverse
+        elif Flags.G in self.flags:
+            return sort._general_numeric, Flags.R in self.flags
         elif Flags.H in self.flags:
-            key = sort._human_readable
+            return sort._human_readable, Flags.R in self.flags
         else:
-            key = lambda x: x
-        self.content = sorted((x for x in self.source), key=key, reverse=(Flags.R in self.flags))
+            return None, Flags.R in self.flags
+
+    def gen(self):
+        key, reverse = self._key()
+        if self.max_memory is not None:
+            yield from self._external_sort(key, reverse)
+            return
+        if self.workers is not None and self.workers > 1:
+            yield from self._parallel_sort(key, reverse)
+            return
+        self.content = sorted((x for x in self.source), key=key, reverse=reverse)
         # the above generator expression avoids calling __len__ where it may not be defined
         yield from self.content
 
+    def _runs(self):
+        """Splits the source into lists, each taking approximately at most max_memory bytes"""
+        run, size = [], 0
+        for elem in self.source:
+            run.append(elem)
+            size += sys.getsizeof(elem)
+            if size >= self.max_memory:
+                yield run
+                run, size = [], 0
+        if run:
+            yield run
 
-@make_pipe
-def sed(source, command, src, dest, flags=NO_FLAGS):
+    def _sorted_runs(self, runs, key, reverse):
+        """Sorts each run; if workers were requested the runs are sorted in a pool of processes"""
+        if self.workers is None or self.workers <= 1:
+            yield from (_sort_run(run, key, reverse) for run in runs)
+            return
+        with ProcessPoolExecutor(self.workers) as executor:
+            yield from _executor_map(executor, _sort_run, runs, self.workers, key, reverse)
+
+    def _parallel_sort(self, key, reverse):
+        content = [x for x in self.source]
+        if len(content) < sort._PARALLEL_MIN_LEN:
+            yield from _undecorate(_sort_run(content, key, reverse), key)
+            return
+        chunk_len = -(-len(content) // self.workers)
+        chunks = [content[i:i + chunk_len] for i in range(0, len(content), chunk_len)]
+        del content
+        sorted_chunks = list(self._sorted_runs(chunks, key, reverse))
+        merged = heapq.merge(*sorted_chunks, key=None if key is None else itemgetter(0), reverse=reverse)
+        yield from _undecorate(merged, key)
+
+    def _external_sort(self, key, reverse):
+        runs = self._runs()
+        first = next(runs, None)
+        second = next(runs, None)
+        if second is None:  # everything fits in memory, no need to touch the disk
+            yield from _undecorate(_sort_run(first or [], key, reverse), key)
+            return
+        with tempfile.TemporaryDirectory(prefix="pysh_sort_") as tmp_dir:
+            run_files = []
+            for run_no, run in enumerate(self._sorted_runs(chain([first, second], runs), key, reverse)):
+                run_files.append(_spill_run(run, os.path.join(tmp_dir, "run{}".format(run_no))))
+            merged = heapq.merge(*(_read_run(fname) for fname in run_files),
+                                 key=None if key is None else itemgetter(0), reverse=reverse)
+            yield from _undecorate(merged, key)
+
+
+_SPILL_BATCH = 1024
+_KEY_SPEC_RE = re.compile(r"^(\d+)(?:,(\d+))?([ghnr]*)$")
+
+
+class _Reversed:
+    """Wrapper inverting the ordering of a value; used for keys sorted in reverse among not reversed ones"""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+class _FieldKey:
+    """
+    Key function for sort with GNU-style key definitions; computes the tuple of keys of given line
+    It's a class rather than a closure so that it can be sent to worker processes
+    """
+
+    def __init__(self, keys, delimiter, flags):
+        self.delimiter = delimiter
+        self.joiner = " " if delimiter is None else delimiter
+        self.keys = []
+        for key in keys:
+            match = _KEY_SPEC_RE.match(str(key))
+            if not match or int(match.group(1)) < 1 or match.group(2) and int(match.group(2)) < int(match.group(1)):
+                raise ValueError("Invalid key definition: {!r}".format(key))
+            start, end, opts = int(match.group(1)) - 1, match.group(2) and int(match.group(2)), match.group(3)
+            if not opts:  # keys without their own options use the global ones
+                opts = "g" * (Flags.G in flags) + "h" * (Flags.H in flags) + "r" * (Flags.R in flags)
+            if "h" in opts:
+                convert = sort._human_readable
+            elif "g" in opts or "n" in opts:
+                convert = sort._general_numeric
+            else:
+                convert = None
+            self.keys.append((start, end, convert, "r" in opts))
+        directions = {reverse for _, _, _, reverse in self.keys}
+        # if all the keys have the same direction, the sort itself is reversed; otherwise the reversed keys are wrapped
+        self.reverse = directions == {True}
+        self.wrap_reversed = len(directions) > 1
+
+    def __call__(self, line):
+        fields = line.split(self.delimiter)
+        result = []
+        for start, end, convert, reverse in self.keys:
+            value = self.joiner.join(fields[start:end])
+            if convert is not None:
+                try:
+                    value = convert(value)
+                except ValueError:
+                    value = 0  # like GNU sort, treat missing or non-numeric fields as zero
+            result.append(_Reversed(value) if reverse and self.wrap_reversed else value)
+        return tuple(result)
+
+
+def _sort_run(run, key, reverse):
+    """Sorts a list of elements; if key is given returns (key, element) pairs, so keys are computed only once"""
+    if key is None:
+        run.sort(reverse=reverse)
+        return run
+    decorated = [(key(elem), elem) for elem in run]
+    decorated.sort(key=itemgetter(0), reverse=reverse)
+    return decorated
+
+
+def _undecorate(elems, key):
+    return elems if key is None else map(itemgetter(1), elems)
+
+
+def _spill_run(run, filename):
+    """Saves sorted run to a file in batches of pickled elements"""
+    with open(filename, "wb") as outfile:
+        for i in range(0, len(run), _SPILL_BATCH):
+            pickle.dump(run[i:i + _SPILL_BATCH], outfile, pickle.HIGHEST_PROTOCOL)
+    return filename
+
+
+def _read_run(filename):
+    with open(filename, "rb") as infile:
+        while True:
+            try:
+                yield from pickle.load(infile)
+            except EOFError:
+                return
+
+
+class sed(ElementwisePipe):
     """
     Supports sed s and y command:
     s - substitute the first occurence (or all occurences with G flag) of src string in each line with dest string
@@ -178,63 +619,100 @@ def sed(source, command, src, dest, flags=NO_FLAGS):
     Flags:
     G - with s command - substitute all (non-overlapping) occurences, instead of only the first one
     """
-    if command == 's':
-        regex = re.compile(src)
-        for line in source:
-            yield regex.sub(dest, line, count=0 if Flags.G in flags else 1)
-    elif command == 'y':
-        assert len(src) == len(dest)
-        mapping = dict(zip(src, dest))
-        for line in source:
-            yield "".join(mapping.get(char, char) for char in line)
 
+    def __init__(self, command, src, dest, flags=NO_FLAGS):
+        super().__init__()
+        self.command = command
+        self.src = src
+        self.dest = dest
+        self.flags = flags
 
-@make_pipe
-def cut(source, fields, delimiter=" ", skip_errors=False):
-    if type(fields) is int:
-        fields_list = {fields}
-    else:
-        fields_list = []
-        fields = fields.split(",")
-        for ind, field in enumerate(fields):
-            if "-" in field:
-                field = field.split("-")
-                field = list(range(int(field[0]), int(field[1]) + 1))
-                fields_list += field
-            else:
-                fields_list += [int(field)]
-    fields_list = sorted(set(fields_list))
-    max_field = max(fields_list)
-    for line_no, line in enumerate(source, start=1):
-        line = line.split(delimiter)
-        if not skip_errors and max_field > len(line):
-            raise ValueError("Line {} has {} fields; {} requested.".format(line_no, len(line), max_field))
-        yield list(elem for ind, elem in enumerate(line, start=1) if ind in fields_list)
+    def element_func(self):
+        if self.command == 's':
+            regex = compile_regex(self.src)
+            dest, max_subs = self.dest, 0 if Flags.G in self.flags else 1
+            return lambda line: regex.sub(dest, line, count=max_subs)
+        elif self.command == 'y':
+            assert len(self.src) == len(self.dest)
+            table = str.maketrans(self.src, self.dest)
+            return lambda line: line.translate(table)
 
 
-def _wcl(filename):
-    with open(filename) as infile:
-        return sum(1 for _ in infile)
+class cut(ElementwisePipe):
+    """
+    Selects given fields from each line, returning them as lists
+    Params:
+    fields - number of the field or comma separated numbers or ranges of fields, e.g. "1,3-4"
+    skip_errors - if False, raises ValueError for lines having fewer fields than requested
+    """
 
+    def __init__(self, fields, delimiter=" ", skip_errors=False):
+        super().__init__()
+        if type(fields) is int:
+            fields_list = {fields}
+        else:
+            fields_list = []
+            fields = fields.split(",")
+            for ind, field in enumerate(fields):
+                if "-" in field:
+                    field = field.split("-")
+                    field = list(range(int(field[0]), int(field[1]) + 1))
+                    fields_list += field
+                else:
+                    fields_list += [int(field)]
+        self.fields_list = sorted(set(fields_list))
+        self.delimiter = delimiter
+        self.skip_errors = skip_errors
 
-def _wcc(filename):
-    with open(filename) as infile:
-        return sum(1 for line in infile for char in line)
+    def element_func(self):
+        fields_list, delimiter, skip_errors = self.fields_list, self.delimiter, self.skip_errors
+        max_field = max(fields_list)
+        indices = [ind - 1 for ind in fields_list]
+        line_numbers = count(1)
 
+        def cut_line(line):
+            line_no = next(line_numbers)
+            line = line.split(delimiter)
+            if len(line) < max_field:
+                if not skip_errors:
+                    raise ValueError("Line {} has {} fields; {} requested.".format(line_no, len(line), max_field))
+                return [line[ind] for ind in indices if ind < len(line)]
+            return [line[ind] for ind in indices]
 
-def _wcw(filename):
-    with open(filename) as infile:
-        return sum(1 for line in infile for token in line.split())
+        return cut_line
 
 
-def _wc_all(filename):
-    chars, words, lines = 0, 0, 0
-    with open(filename) as infile:
-        for line in infile:
-            lines += 1
-            chars += len(line)
-            words += len(line.split())
-    return chars, words, lines
+_WC_BLOCK_SIZE = 2 ** 20
+
+
+def _wc_file(filename, lines_only=False):
+    """
+    Counts characters, words and lines of given file, or only lines which doesn't require decoding it;
+    the file is read in large blocks and the results are cached until it changes (judging by inode, size and mtime)
+    """
+    stat = os.stat(filename)
+    return _wc_file_cached(os.path.abspath(filename), stat.st_ino, stat.st_size, stat.st_mtime_ns, lines_only)
+
+
+@lru_cache(maxsize=256)
+def _wc_file_cached(path, inode, size, mtime_ns, lines_only):
+    if lines_only:
+        lines, last = 0, b"\n"
+        with open(path, "rb") as infile:
+            for block in iter(partial(infile.read, _WC_BLOCK_SIZE), b""):
+                lines += block.count(b"\n")
+                last = block[-1:]
+        return (lines + (last != b"\n"),)  # the last line may lack the newline character
+    chars, words, lines, last = 0, 0, 0, "\n"
+    with open(path, newline="\n") as infile:
+        for block in iter(partial(infile.read, _WC_BLOCK_SIZE), ""):
+            chars += len(block)
+            words += len(block.split())
+            if not last.isspace() and not block[0].isspace():
+                words -= 1  # the word was split between the blocks
+            lines += block.count("\n")
+            last = block[-1]
+    return chars, words, lines + (last != "\n")
 
 
 def _wc_all(gen):
@@ -267,13 +745,21 @@ class wc(PipeElement):
         self.flags = flags
         self.filename = filename
         if filename:
-            with open(filename) as infile:
-                self._count(infile)
+            self._select(list(_wc_file(filename, lines_only=flags == Flags.L)))
         else:
             self.res = ()
 
     def _count(self, gen):
-        self.res = _wc_all(gen)
+        if self.flags == Flags.L:
+            self._select([sum(1 for _ in gen)])
+        else:
+            self._select(_wc_all(gen))
+
+    def _select(self, counts):
+        self.res = counts
+        if self.flags == Flags.L:
+            self.res = tuple(self.res)  # only lines were counted
+            return
         if Flags.L not in self.flags:
             self.res.pop(2)
         if Flags.W not in self.flags:
@@ -302,6 +788,65 @@ class wc(PipeElement):
             return tuple(self.res) == other
 
 
+_NOTHING = object()
+
+
+class merge(Generator):
+    """
+    Merges sorted sources into one sorted sequence (like sort -m), holding only one element of every source in memory
+    Sources can be any iterables or names of files (read line by line, stripping newline characters)
+    Flags (and keys and delimiter) have the same meaning as for sort and need to describe the order of the sources:
+    G - numerical value of (prefix of) the string
+    H - as G, but also support suffixes like K for kilo, M for mega etc.
+    R - reverse ordering
+    Params:
+    key - function computing the key of an element, used instead of the flags
+    unique - output only the first of the elements with equal keys (like sort -mu)
+    ValueError is raised as soon as an element out of order is found in any of the sources
+    """
+
+    def __init__(self, *sources, key=None, flags=NO_FLAGS, unique=False, keys=None, delimiter=None):
+        super().__init__(None)
+        self.sources = sources
+        self.flags = flags
+        self.unique = unique
+        if key is not None:
+            self.key, self.reverse = key, Flags.R in flags
+        else:
+            self.key, self.reverse = sort(flags, keys=keys, delimiter=delimiter)._key()
+
+    @staticmethod
+    def _lines(filename):
+        from .file_utils import _to_absolute  # file_utils imports this module
+        with open(_to_absolute(filename)) as infile:
+            for line in infile:
+                yield line[:-1] if line.endswith("\n") else line
+
+    def _validated(self, num, source):
+        """Generates (key, element) pairs of the source, checking its order"""
+        key, reverse = self.key, self.reverse
+        prev = _NOTHING
+        for elem in source:
+            current = elem if key is None else key(elem)
+            if prev is not _NOTHING and (current < prev if not reverse else prev < current):
+                raise ValueError("Source {} of merge is not sorted: {!r} follows {!r}".format(num, elem, prev_elem))
+            prev, prev_elem = current, elem
+            yield current, elem
+
+    def gen(self):
+        sources = [self._lines(src) if isinstance(src, (str, os.PathLike)) else src for src in self.sources]
+        merged = heapq.merge(*(self._validated(num, src) for num, src in enumerate(sources)),
+                             key=itemgetter(0), reverse=self.reverse)
+        if not self.unique:
+            yield from map(itemgetter(1), merged)
+            return
+        prev = _NOTHING
+        for key, elem in merged:
+            if prev is _NOTHING or key != prev:
+                yield elem
+                prev = key
+
+
 def comm(gen1, gen2, suppress=""):
     """
     Takes two sorted streams and outputs one column with elements unique to the first one,
@@ -372,37 +917,106 @@ def comm(gen1, gen2, suppress=""):
     yield from filter_nones(get_output(elem) for elem in inner_gen())
 
 
-def diff(seq1, seq2, flags=NO_FLAGS, start_num=0):
+def diff(seq1, seq2, flags=NO_FLAGS, start_num=0, output="normal", context=3, names=None, window=None):
     """
-    Compares two sequences and returns the list of differences
+    Compares two sequences and returns the differences - a list, or a generator if window is given
     :param seq1: first sequence or generator to compare
     :param seq2: second sequence or generator to compare
     :param flags: currently ignored
     :param start_num: whether indexing of sequence elements should be zero-based (default) or one-based, or any other number
-    :return: list of differences in standard diff format
+    :param output: "normal", "unified" or "context" - format of the differences, like diff, diff -u and diff -c;
+        line numbers in the latter two are always one-based, as patch expects
+    :param context: number of unchanged lines around the changes in unified and context format
+    :param names: (name of the first sequence, name of the second sequence) - if given, they are put in the header
+        of unified and context format
+    :param window: if given, the sequences are streamed and compared window lines at a time, and the differences are
+        generated lazily - exact for mostly identical sequences, which is what large snapshots usually are
+    :return: list of lines of the differences in standard diff format; with window, a generator of them
     """
     if flags != NO_FLAGS:
         warn("diff currently doesn't support any flags")
-    seq1 = list(seq1)
-    seq2 = list(seq2)
-    result = []
-    matcher = SequenceMatcher(a=seq1, b=seq2)
-    opcodes = matcher.get_opcodes()
-    for opcode in opcodes:
-        opcode = list(opcode)
-        if opcode[0] == 'equal':
-            continue  # nothing to do
-        op = {'insert': 'a', 'delete': 'd', 'replace': 'c'}[opcode[0]]
-        left = str(opcode[1] + start_num - int(op == "a")) if opcode[2] - 1 <= opcode[1] else '{},{}'.format(
-            opcode[1] + start_num, opcode[2] - 1 + start_num)
-        right = str(opcode[3] + start_num - int(op == "d")) if opcode[4] - 1 <= opcode[3] else '{},{}'.format(
-            opcode[3] + start_num, opcode[4] - 1 + start_num)
-        result += ["{}{}{}".format(left, op, right)]
-        if op in 'dc':
-            result += ["< " + seq1[i] for i in range(opcode[1], opcode[2])]
-        if op in 'ac':
-            result += ["> " + seq2[i] for i in range(opcode[3], opcode[4])]
-    return result
+    if output not in ("normal", "unified", "context"):
+        raise ValueError("Unknown diff output format '{}'".format(output))
+    if window is None:
+        ops = diff_engine.opcodes(list(seq1), list(seq2))
+    else:
+        ops = diff_engine.window_opcodes(seq1, seq2, window)
+    if output == "normal":
+        result = diff_engine.normal_format(ops, start_num)
+    elif output == "unified":
+        result = diff_engine.unified_format(ops, context, names)
+    else:
+        result = diff_engine.context_format(ops, context, names)
+    return result if window is not None else list(result)
+
+
+class cmd(Generator):
+    """
+    Pipes the input sequence through given shell command, e.g. cat("file") | cmd("sort -u") | grep("abc")
+    The elements are written to the command's stdin one per line, by a background thread in large chunks,
+    while its output is generated line by line (stripping newline characters)
+    Only the last max_stderr bytes of stderr are retained; they are included in CommandError,
+    raised after the output ends if the command returned non-zero exit code (unless raise_on_error is False)
+    Exceptions raised upstream are re-raised after the command ends; if the pipeline stops consuming the output
+    early, the command is killed
+    """
+
+    def __init__(self, command, encoding="utf-8", raise_on_error=True, max_stderr=64 * 1024, buffer_size=2 ** 20):
+        super().__init__(None)
+        self.command = command
+        self.encoding = encoding
+        self.raise_on_error = raise_on_error
+        self.max_stderr = max_stderr
+        self.buffer_size = buffer_size
+
+    def gen(self):
+        process = subprocess.Popen(self.command, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, bufsize=self.buffer_size, start_new_session=True)
+        stderr = _TailReader(process.stderr, self.max_stderr)
+        writer = _StdinWriter(process.stdin, iter_batches(self.source), self.encoding)
+        stdout = io.TextIOWrapper(process.stdout, encoding=self.encoding, newline="\n")
+        try:
+            for line in stdout:
+                yield _strip_newline(line)
+            returncode = process.wait()
+            writer.join()
+            if writer.exception is not None:
+                raise writer.exception
+            if returncode != 0 and self.raise_on_error:
+                raise CommandError('Command returned {} exit code. Stderr:\n{}'.format(
+                    returncode, stderr.result(self.encoding)))
+        finally:
+            if process.poll() is None:
+                _kill_command(process)
+                process.wait()
+            stderr.result()  # the reader closes stderr itself
+            stdout.close()
+
+
+class _StdinWriter(Thread):
+    """Writes batches of elements to command's stdin, one element per line, closing it at the end"""
+
+    def __init__(self, stdin, batches, encoding):
+        super().__init__(name="pysh-cmd", daemon=True)
+        self.stdin = stdin
+        self.batches = batches
+        self.encoding = encoding
+        self.exception = None
+        self.start()
+
+    def run(self):
+        try:
+            for batch in self.batches:
+                self.stdin.write(("\n".join(map(str, batch)) + "\n").encode(self.encoding))
+        except BrokenPipeError:
+            pass  # the command exited without reading whole input, e.g. head
+        except Exception as e:
+            self.exception = e
+        finally:
+            try:
+                self.stdin.close()
+            except BrokenPipeError:
+                pass
 
 
 @make_pipe
@@ -410,6 +1024,8 @@ def head(source, n=10):
     """Returns first n elements of given sequence. If n is negative returns everything BUT last |n| elements."""
     if n == 0:
         return
+    elif n < 0 and isinstance(source, RandomAccessGenerator):
+        yield from source[source.position:len(source) + n]
     elif n > 0:
         while n:
             yield next(source)
@@ -428,6 +1044,8 @@ def tail(source, n=10):
     """Returns last n elements of given sequence. If n is negative returns everything BUT first |n| elements."""
     if n == 0:
         return
+    elif isinstance(source, RandomAccessGenerator):
+        yield from source[max(source.position, len(source) - n) if n > 0 else source.position - n:]
     elif n > 0:
         buffer = deque()
         for elem in source:
@@ -0,0 +1,218 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue, Full
+from threading import Thread, Event
+
+from .generator import Generator, PipeElement, generator, make_drain, iter_batches, _executor_map, DEFAULT_BATCH_SIZE
+
+
+def _map_chunk(chunk, func):
+    return [func(elem) for elem in chunk]
+
+
+class pmap(Generator):
+    """
+    Parallel map: calls func for every element of the input sequence in a pool of worker processes
+    The elements are sent to the workers in chunks of chunksize elements; at most max_pending chunks
+    (by default twice the number of workers) are in flight at once, so the memory usage doesn't grow with the input
+    func (and the elements) need to be picklable, so e.g. lambdas can't be used
+    Params:
+    workers - number of worker processes; by default number of processors
+    ordered - if True results are generated in the order of input, otherwise in the order of completion
+    """
+
+    def __init__(self, func, workers=None, chunksize=1024, ordered=True, max_pending=None):
+        super().__init__(None)
+        self.func = func
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.ordered = ordered
+        self.max_pending = max_pending or 2 * self.workers
+
+    def batches(self, size=DEFAULT_BATCH_SIZE):
+        """Generates the results chunk by chunk, so the size is given by chunksize, not by size"""
+        with ProcessPoolExecutor(self.workers) as executor:
+            yield from _executor_map(executor, _map_chunk, iter_batches(self.source, self.chunksize),
+                                     self.max_pending, self.func, ordered=self.ordered)
+
+    def gen(self):
+        for chunk in self.batches():
+            yield from chunk
+
+
+class _Failure:
+    """Exception raised in a background thread, to be re-raised in the consuming one"""
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+_END = object()
+
+
+class buffer(Generator):
+    """
+    Reads the input sequence ahead in a background thread, into a queue of at most maxsize batches
+    of batch_size elements each, so that the upstream (e.g. reading a file or decompressing it, which releases GIL)
+    runs concurrently with the downstream processing - like mbuffer in shell
+    Exceptions raised upstream are re-raised downstream; when the downstream stops consuming early,
+    the thread stops reading as soon as the element it is currently waiting for is read
+    """
+
+    def __init__(self, maxsize=16, batch_size=DEFAULT_BATCH_SIZE):
+        super().__init__(None)
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+
+    def batches(self, size=DEFAULT_BATCH_SIZE):
+        """Generates the batches read in the background, so the size is given by batch_size, not by size"""
+        queue = Queue(self.maxsize)
+        stopped = Event()
+        source_batches = iter_batches(self.source, self.batch_size)
+        # the thread must not reference self, otherwise the pipe element would never be garbage collected
+        # (and closed) when the downstream stops consuming it early
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    continue
+            return False
+
+        def read_ahead():
+            try:
+                for batch in source_batches:
+                    if not put(batch):
+                        return
+            except Exception as e:
+                put(_Failure(e))
+            else:
+                put(_END)
+
+        thread = Thread(target=read_ahead, name="pysh-buffer", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = queue.get()
+                if item is _END:
+                    return
+                elif isinstance(item, _Failure):
+                    raise item.exception
+                yield item
+        finally:
+            stopped.set()
+            thread.join()
+
+    def gen(self):
+        for batch in self.batches():
+            yield from batch
+
+
+def _run_branch(branch, stream):
+    if isinstance(branch, PipeElement):
+        result = branch.__ror__(stream)
+        return list(result) if isinstance(result, Generator) else result
+    return branch(stream)
+
+
+class _Branch:
+    """Branch of tee, run in its own thread, fed with batches through a bounded queue"""
+
+    def __init__(self, branch, maxsize):
+        self.queue = Queue(maxsize)
+        self.result = None
+        self.error = None
+        self.thread = Thread(target=self._run, args=(branch,), name="pysh-tee", daemon=True)
+        self.thread.start()
+
+    def _elements(self):
+        while True:
+            batch = self.queue.get()
+            if batch is _END:
+                return
+            yield from batch
+
+    def _run(self, branch):
+        try:
+            self.result = _run_branch(branch, generator(self._elements()))
+        except Exception as e:
+            self.error = e
+
+    def put(self, item):
+        """Puts the item in the queue, unless the branch finished (consuming only part of its input) or failed"""
+        while self.thread.is_alive():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except Full:
+                continue
+        self.raise_error()
+
+    def close(self):
+        self.put(_END)
+        self.thread.join()
+
+    def raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+
+class tee(Generator):
+    """
+    Passes the input sequence through unchanged, feeding it in the same pass also to the branches, which can be:
+    drains, e.g. tee(to_file("all.log")), functions taking the sequence, e.g. lambda lines: lines | grep("ERROR") | wc(),
+    or other pipe elements - then all they generate is collected into a list
+    Every branch runs in its own thread, reading batches of batch_size elements from a queue of at most maxsize
+    batches, so the memory usage is bounded, but the slowest branch limits the speed of the whole pipeline
+    When the input ends, the values returned by the branches are available as results;
+    exceptions raised in the branches are re-raised downstream
+    If the downstream stops consuming early, the branches get only the consumed part of the input
+    """
+
+    def __init__(self, *branches, maxsize=16, batch_size=DEFAULT_BATCH_SIZE):
+        super().__init__(None)
+        self.branches = branches
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.results = None
+
+    def batches(self, size=DEFAULT_BATCH_SIZE):
+        """Generates the batches passed to the branches, so the size is given by batch_size, not by size"""
+        branches = [_Branch(branch, self.maxsize) for branch in self.branches]
+        try:
+            for batch in iter_batches(self.source, self.batch_size):
+                for branch in branches:
+                    branch.put(batch)
+                yield batch
+        finally:
+            for branch in branches:
+                branch.close()
+        for branch in branches:
+            branch.raise_error()
+        self.results = [branch.result for branch in branches]
+
+    def gen(self):
+        for batch in self.batches():
+            yield from batch
+
+
+@make_drain
+def fork(source, *branches, maxsize=16, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Feeds the input sequence to all the branches (see tee) in a single pass, returning the list of their results,
+    e.g. errors, count = cat("app.log") | fork(lambda lines: lines | grep("ERROR") | to_list(), wc(Flags.L))
+    The last branch runs in the current thread, the others in threads of their own
+    """
+    if not branches:
+        raise ValueError("fork needs at least one branch")
+    others = source | tee(*branches[:-1], maxsize=maxsize, batch_size=batch_size)
+    try:
+        last = _run_branch(branches[-1], others)
+        for _ in others:
+            pass  # the last branch might have not consumed everything
+    except BaseException:
+        others._gen.close()  # stops the other branches
+        raise
+    return others.results + [last]
@@ -0,0 +1,61 @@
+"""
+Regular expression engine used by the tools (grep, sed, find etc.) - standard library re or, if it is installed,
+regex module, which supports more syntax and releases GIL while matching
+Compiled patterns are kept in a cache shared by all the tools, so rebuilding pipelines doesn't recompile them
+"""
+import re
+from functools import lru_cache
+
+try:
+    import regex
+except ImportError:
+    regex = None
+
+ENGINES = {"re": re}
+if regex is not None:
+    ENGINES["regex"] = regex
+
+REGEX_ENGINE = "re"  # engine used for patterns given as strings
+
+_CACHE_SIZE = 1024
+_PATTERN_TYPES = (re.Pattern,) if regex is None else (re.Pattern, regex.Pattern)
+ERRORS = (re.error,) if regex is None else (re.error, regex.error)  # raised for invalid patterns
+
+
+def set_regex_engine(name):
+    """Sets the engine ("re" or "regex") used to compile patterns given as strings from now on"""
+    global REGEX_ENGINE
+    if name not in ENGINES:
+        raise ValueError("Unknown (or not installed) regex engine '{}', available: {}".format(name, ", ".join(ENGINES)))
+    REGEX_ENGINE = name
+
+
+def compile_regex(pattern, flags=0, engine=None):
+    """
+    Compiles the pattern with given engine (by default the current one), or returns it from the cache;
+    already compiled patterns are returned as they are, unless flags add something to their own
+    """
+    if is_compiled(pattern):
+        if flags & ~pattern.flags == 0:
+            return pattern
+        return _compile(engine_of(pattern), pattern.pattern, pattern.flags | flags)
+    return _compile(engine or REGEX_ENGINE, pattern, flags)
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def _compile(engine, pattern, flags):
+    return ENGINES[engine].compile(pattern, flags)
+
+
+def is_compiled(obj):
+    return isinstance(obj, _PATTERN_TYPES)
+
+
+def engine_of(pattern):
+    """Name of the engine the pattern was compiled with"""
+    return "regex" if regex is not None and isinstance(pattern, regex.Pattern) else "re"
+
+
+def releases_gil(pattern):
+    """Whether the pattern can be matched concurrently in many threads"""
+    return engine_of(pattern) == "regex"
@@ -0,0 +1,280 @@
+"""
+Sketches - drains summarizing streams too large to be sorted or kept in memory, in one pass and bounded memory
+Every sketch can be merged with another one of the same kind and parameters, e.g. computed for another file
+or in another process: (cat("a.log") | count_distinct()).merge(cat("b.log") | count_distinct())
+"""
+import hashlib
+import heapq
+import math
+import pickle
+import random
+from collections import Counter
+
+from .generator import PipeElement, iter_batches, DEFAULT_BATCH_SIZE
+
+
+class _Sketch(PipeElement):
+    """Drain updating the sketch with all elements of the input and returning the sketch itself"""
+
+    def __ror__(self, source):
+        for batch in iter_batches(source, DEFAULT_BATCH_SIZE):
+            self._update_batch(batch)
+        return self
+
+    def update(self, iterable):
+        """Adds elements of the iterable to the sketch; returns the sketch"""
+        return self.__ror__(iterable)
+
+    def _update_batch(self, batch):
+        raise NotImplementedError()
+
+    def merge(self, other):
+        """Merges the other sketch into this one, as if it was updated with all the elements of the other one"""
+        raise NotImplementedError()
+
+
+class top_k(_Sketch):
+    """
+    Most frequent elements (heavy hitters), found with Space-Saving algorithm: only capacity counters are kept,
+    so the counts are approximate - they may be overestimated by at most the number of elements divided by capacity
+    (the upper bound of the error of every count is given by errors)
+    Params:
+    k - number of the elements returned by most_common
+    capacity - number of counters; by default 10 * k
+    """
+
+    def __init__(self, k=10, capacity=None):
+        self.k = k
+        self.capacity = capacity or 10 * k
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+
+    def _min_count(self):
+        """Count of the elements which are not tracked may be at most the minimal tracked count"""
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def _merge_counts(self, counts, errors, min_count):
+        own_min = self._min_count()
+        keys = self.counts.keys() | counts.keys()
+        merged = {key: self.counts.get(key, own_min) + counts.get(key, min_count) for key in keys}
+        kept = heapq.nlargest(self.capacity, merged, key=merged.get)
+        self.errors = {key: self.errors.get(key, own_min) + errors.get(key, min_count) for key in kept}
+        self.counts = {key: merged[key] for key in kept}
+
+    def _update_batch(self, batch):
+        self.total += len(batch)
+        counts = Counter(batch)
+        self._merge_counts(counts, {}, 0)
+
+    def merge(self, other):
+        self.total += other.total
+        self._merge_counts(other.counts, other.errors, other._min_count())
+        return self
+
+    def most_common(self, n=None):
+        """List of (element, count) pairs of n (by default k) elements with the highest counts"""
+        return heapq.nlargest(n or self.k, self.counts.items(), key=lambda item: item[1])
+
+    def __repr__(self):
+        return repr(self.most_common())
+
+
+def _digest(elem, size):
+    """blake2b digest of the type-tagged canonical bytes of the element, the same in every process"""
+    return hashlib.blake2b(_canonical(elem), digest_size=size).digest()
+
+
+def _canonical(elem):
+    """
+    Bytes identifying the element: strings and bytes are never equal, equal numbers (1, 1.0, True) are the same;
+    other elements are pickled, so they have to be picklable and are the same only if their pickles are
+    (e.g. (1,) and (1.0,) are not)
+    """
+    if isinstance(elem, str):
+        return b"s" + elem.encode("utf-8", "surrogatepass")
+    if isinstance(elem, bytes):
+        return b"b" + elem
+    if isinstance(elem, (int, float)):
+        if isinstance(elem, bool) or isinstance(elem, float) and elem.is_integer():
+            elem = int(elem)
+        return b"n" + repr(elem).encode()
+    return b"p" + pickle.dumps(elem, 4)  # fixed protocol, so that the pickles don't depend on the Python version
+
+
+def _hash64(elem):
+    return int.from_bytes(_digest(elem, 8), "big")
+
+
+class count_distinct(_Sketch):
+    """
+    Approximate number of distinct elements, estimated with HyperLogLog algorithm, using 2 ** precision bytes;
+    the relative standard error is about 1.04 / sqrt(2 ** precision), i.e. 0.8% for the default precision 14
+    The elements are hashed with blake2b (of their pickle, unless they are strings, bytes or numbers), so
+    the sketches computed in different processes can be merged
+    """
+
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError("Precision needs to be between 4 and 18")
+        self.precision = precision
+        self.registers = bytearray(2 ** precision)
+
+    def _update_batch(self, batch):
+        precision, registers = self.precision, self.registers
+        bits = 64 - precision
+        mask = (1 << bits) - 1
+        for elem in set(batch):
+            hash_ = _hash64(elem)
+            index = hash_ >> bits
+            rank = bits - (hash_ & mask).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Only sketches with the same precision can be merged")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))  # linear counting is more accurate for small cardinalities
+        return round(estimate)
+
+    def __len__(self):
+        return self.estimate()
+
+    def __repr__(self):
+        return repr(self.estimate())
+
+
+class quantiles(_Sketch):
+    """
+    Approximate quantiles of the (comparable, e.g. numeric) elements, computed with KLL sketch;
+    the memory is proportional to k and the rank error is about 1.7 / k (e.g. below 1% for the default k=200)
+    Params:
+    seed - seed of the random generator used by the sketch, to make the results repeatable
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.compactors = [[]]
+        self.count = 0
+        self._random = random.Random(seed)
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return int(math.ceil(self.k * (2 / 3) ** depth)) + 1
+
+    def _compress(self):
+        for level in range(len(self.compactors)):
+            items = self.compactors[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append([])
+                items.sort()
+                offset = self._random.random() < 0.5
+                odd = items.pop() if len(items) % 2 else None  # the largest item stays if the number is odd
+                self.compactors[level + 1].extend(items[offset::2])
+                items[:] = [] if odd is None else [odd]
+
+    def _size(self):
+        return sum(map(len, self.compactors))
+
+    def _max_size(self):
+        return sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def _update_batch(self, batch):
+        self.count += len(batch)
+        self.compactors[0].extend(batch)
+        while self._size() >= self._max_size():
+            self._compress()
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for items, other_items in zip(self.compactors, other.compactors):
+            items.extend(other_items)
+        self.count += other.count
+        while self._size() >= self._max_size():
+            self._compress()
+        return self
+
+    def _weighted(self):
+        """Sorted (item, weight) pairs; items at level h represent 2 ** h elements each"""
+        return sorted((item, 2 ** level) for level, items in enumerate(self.compactors) for item in items)
+
+    def quantile(self, q):
+        """Element with approximately q * count elements less or equal to it; None for empty input"""
+        return self.quantiles([q])[0]
+
+    def quantiles(self, qs):
+        weighted = self._weighted()
+        total = sum(weight for _, weight in weighted)
+        result = []
+        for q in qs:
+            if not 0 <= q <= 1:
+                raise ValueError("Quantile needs to be between 0 and 1")
+            cumulative = 0
+            value = None
+            for item, weight in weighted:
+                value = item
+                cumulative += weight
+                if cumulative >= q * total:
+                    break
+            result.append(value)
+        return result
+
+    def rank(self, value):
+        """Approximate fraction of the elements less or equal to value"""
+        weighted = self._weighted()
+        total = sum(weight for _, weight in weighted)
+        return sum(weight for item, weight in weighted if item <= value) / total if total else 0.0
+
+    def __repr__(self):
+        return repr(self.quantiles([0, 0.25, 0.5, 0.75, 1]))
+
+
+class BloomFilter:
+    """
+    Set of elements, which may falsely report an element absent from it as present; the probability of that
+    is at most false_positive_rate as long as it holds at most capacity elements
+    """
+
+    def __init__(self, capacity, false_positive_rate=0.01):
+        if not 0 < false_positive_rate < 1:
+            raise ValueError("False positive rate needs to be between 0 and 1")
+        self.size = max(8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, elem):
+        digest = _digest(elem, 16)
+        hash1, hash2 = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big") | 1
+        return [(hash1 + i * hash2) % self.size for i in range(self.hash_count)]
+
+    def add(self, elem):
+        """Adds the element, returning whether it was (probably) already present"""
+        bits = self.bits
+        present = True
+        for position in self._positions(elem):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                present = False
+                bits[position >> 3] |= mask
+        return present
+
+    def __contains__(self, elem):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(elem))
+
+    def merge(self, other):
+        """Adds all the elements of the other filter (which needs to have the same size) to this one"""
+        if (other.size, other.hash_count) != (self.size, self.hash_count):
+            raise ValueError("Only filters with the same size and number of hashes can be merged")
+        self.bits = bytearray(map(int.__or__, self.bits, other.bits))
+        return self
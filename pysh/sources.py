@@ -1,12 +1,31 @@
 import bz2
+import gzip
+import io
+import locale
+import lzma
+import mmap
+import os
+import re
+import struct
+import subprocess
+import sys
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 
 from pysh import wc, Flags
 from pysh.file_utils import _to_absolute
-from pysh.generator import make_source, generator
+from pysh.generator import (make_source, generator, RandomAccessGenerator, CommandError, _TailReader,
+                            _kill_command, _executor_map, _strip_newline)
 
 
-def cat(filename, with_len=False):
-    """Generates all content from given file line by line, stripping newline characters"""
+def cat(filename, with_len=False, indexed=False):
+    """
+    Generates all content from given file line by line, stripping newline characters
+    If indexed is True, returns IndexedFile, which also allows random access to the lines
+    """
+    if indexed:
+        return IndexedFile(filename)
     if with_len:
         len_ = wc(filename, Flags.L)[0]
     else:
@@ -14,28 +33,344 @@ def cat(filename, with_len=False):
     filename = _to_absolute(filename)
 
     def inner():
-        with open(filename) as infile:
-            yield from (line[:-1] for line in infile)
+        with open(filename, newline="\n") as infile:  # like wc(filename, Flags.L), lone \r doesn't end a line
+            yield from map(_strip_newline, infile)
 
     return generator(inner(), len_=len_)
 
 
+_INDEX_HEADER = struct.Struct("=8s8sqq")  # magic, byte order, size and mtime of the indexed file
+_INDEX_MAGIC = b"PYSHIDX1"
+_BYTE_ORDER = sys.byteorder.encode().ljust(8, b"\0")  # as unpacked from the header
+
+
+class IndexedFile(RandomAccessGenerator):
+    """
+    Lines of a file (stripped of newline characters), accessible directly by their numbers:
+    f[i], f[i:j] (as a generator), reversed(f) and len(f); head and tail seek directly to the lines they need
+    The file is memory mapped and the offsets of the lines are kept in a sidecar index file (by default
+    .<filename>.pysh_index next to it), built at the first use and rebuilt when the size or mtime of the file changes;
+    if the index file can't be written, the index is kept in memory only
+    The memory maps are released by close() (or at the end of with block, or when the object is deleted)
+    """
+
+    def __init__(self, filename, index_path=None, encoding=None):
+        super().__init__()
+        self.filename = _to_absolute(filename)
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        if index_path is None:
+            index_path = self.filename.parent / ".{}.pysh_index".format(self.filename.name)
+        self.index_path = index_path
+        self._data = b""
+        self._index = None
+        stat = os.stat(self.filename)
+        with open(self.filename, "rb") as infile:
+            if stat.st_size:
+                self._data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._offsets = self._load_index(stat)
+            if self._offsets is None:
+                self._offsets = self._build_index(stat)
+        except BaseException:
+            self.close()
+            raise
+
+    def _load_index(self, stat):
+        try:
+            with open(self.index_path, "rb") as infile:
+                index = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if len(index) < _INDEX_HEADER.size or _INDEX_HEADER.unpack_from(index) != (
+                _INDEX_MAGIC, _BYTE_ORDER, stat.st_size, stat.st_mtime_ns):
+            index.close()
+            return None
+        self._index = index
+        return memoryview(index)[_INDEX_HEADER.size:].cast("q")
+
+    def close(self):
+        """Releases the memory maps of the file and its index; the lines can't be accessed afterwards"""
+        offsets = getattr(self, "_offsets", None)
+        if isinstance(offsets, memoryview):
+            offsets.release()
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        if hasattr(self, "_index"):
+            self.close()
+
+    def _build_index(self, stat):
+        offsets = array("q", [0])  # start of each line and the end of the last one
+        offsets.extend(match.end() for match in re.finditer(b"\n", self._data))
+        if offsets[-1] != stat.st_size:
+            offsets.append(stat.st_size)  # the last line doesn't end with newline
+        tmp_path = "{}.{}.tmp".format(self.index_path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as outfile:
+                outfile.write(_INDEX_HEADER.pack(_INDEX_MAGIC, _BYTE_ORDER, stat.st_size, stat.st_mtime_ns))
+                offsets.tofile(outfile)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            pass  # e.g. read-only directory - just keep the index in memory
+        return offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _decode(self, line):
+        if line.endswith(b"\n"):
+            line = line[:-2] if line.endswith(b"\r\n") else line[:-1]
+        return line.decode(self.encoding)
+
+    def element(self, index):
+        return self._decode(self._data[self._offsets[index]:self._offsets[index + 1]])
+
+    def gen(self):
+        with open(self.filename, "rb") as infile:
+            infile.seek(self._offsets[self.position])
+            for line in infile:
+                if self.position >= len(self):
+                    return  # the file was appended to after indexing
+                self.position += 1
+                yield self._decode(line)
+
+
 @make_source(len_=lambda lst: len(lst))
 def cat_list(lst):
     yield from lst
 
 
-def bz2_cat(filename, with_len=False):
+_CHUNK_SIZE = 2 ** 20
+_FORMATS = {"bz2": bz2.open, "gz": gzip.open, "xz": lzma.open}
+_MAGIC = [(b"BZh", "bz2"), (b"\x1f\x8b", "gz"), (b"\xfd7zXZ\x00", "xz")]
+
+
+def _lines(chunks, encoding):
+    """Splits chunks of bytes into decoded lines, stripping newline characters (\\n or \\r\\n)"""
+    rest = b""
+    for chunk in chunks:
+        if rest:
+            chunk = rest + chunk
+        end = chunk.rfind(b"\n")
+        if end == -1:
+            rest = chunk
+            continue
+        rest = chunk[end + 1:]
+        lines = chunk[:end].decode(encoding).split("\n")
+        if any(line.endswith("\r") for line in lines):
+            lines = [line[:-1] if line.endswith("\r") else line for line in lines]
+        yield from lines
+    if rest:
+        line = rest.decode(encoding)
+        yield line[:-1] if line.endswith("\r") else line
+
+
+def _read_chunks(opener, filename):
+    with opener(filename, "rb") as infile:
+        yield from iter(partial(infile.read, _CHUNK_SIZE), b"")
+
+
+def _detect_format(filename):
+    with open(filename, "rb") as infile:
+        header = infile.read(6)
+    return next((fmt for magic, fmt in _MAGIC if header.startswith(magic)), None)
+
+
+# bz2 stream is a header (b"BZh" and block size digit), blocks, each starting with 48-bit magic number followed by
+# 32-bit CRC, and end-of-stream marker (48-bit magic, combined CRC), padded to whole byte; blocks are not byte aligned
+_BZ2_BLOCK_MAGIC = 0x314159265359
+_BZ2_EOS_MAGIC = 0x177245385090
+_BZ2_SCAN_WINDOW = 2 ** 24
+
+
+def _bit_patterns(magic):
+    """For each of 8 bit offsets, whole bytes contained in 48-bit magic starting at that offset, and their position"""
+    patterns = []
+    for shift in range(8):
+        shifted = (magic << (16 - shift)).to_bytes(8, "big")
+        patterns.append((shifted[0:6], 0) if shift == 0 else (shifted[1:6], 1))
+    return patterns
+
+
+_BZ2_PATTERNS = [(pattern, skip, shift, is_block) for is_block, magic in [(True, _BZ2_BLOCK_MAGIC), (False, _BZ2_EOS_MAGIC)]
+                 for shift, (pattern, skip) in enumerate(_bit_patterns(magic))]
+
+
+def _read_bits(data, bit, count):
+    first, last = bit // 8, (bit + count + 7) // 8
+    return int.from_bytes(data[first:last], "big") >> (last * 8 - bit - count) & ((1 << count) - 1)
+
+
+def _bz2_markers(data):
+    """Bit positions of (candidate) block and end of stream magic numbers, as (position, is_block) in order"""
+    for start in range(0, len(data), _BZ2_SCAN_WINDOW):
+        end = min(start + _BZ2_SCAN_WINDOW, len(data))
+        markers = []
+        for pattern, skip, shift, is_block in _BZ2_PATTERNS:
+            pos = data.find(pattern, max(start - 1, 0), end + len(pattern))
+            while pos != -1:
+                bit = (pos - skip) * 8 + shift
+                if start * 8 <= bit < end * 8 and pos >= skip and _read_bits(data, bit, 48) == (
+                        _BZ2_BLOCK_MAGIC if is_block else _BZ2_EOS_MAGIC):
+                    markers.append((bit, is_block))
+                pos = data.find(pattern, pos + 1, end + len(pattern))
+        yield from sorted(markers)
+
+
+def _bz2_blocks(data):
+    """Generates (start bit, end bit, block size digit, CRC) of every block, from all the streams in the file"""
+    if data[:3] != b"BZh":
+        raise OSError("Invalid data stream")
+    stream_start, level = 0, data[3]
+    block = None
+    for bit, is_block in _bz2_markers(data):
+        if bit < (stream_start + 4) * 8:
+            continue
+        if not is_block:
+            next_stream = (bit + 80 + 7) // 8
+            if next_stream != len(data) and data[next_stream:next_stream + 3] != b"BZh":
+                continue  # the magic number appeared by chance in compressed data
+            if block is not None:
+                yield block + (bit,)
+                block = None
+            if next_stream == len(data):
+                return
+            stream_start, level = next_stream, data[next_stream + 3]
+        else:
+            if block is not None:
+                yield block + (bit,)
+            block = (bit, level, _read_bits(data, bit + 48, 32))
+    if block is not None:
+        raise OSError("Compressed file ended before the end-of-stream marker was reached")
+
+
+def _decompress_bz2_block(block, data):
+    """Decompresses the block, wrapped in a stream of its own; returns None if it is not valid"""
+    start, level, crc, end = block
+    bits = _read_bits(data, start, end - start) << 80 | _BZ2_EOS_MAGIC << 32 | crc  # stream CRC of single block
+    bit_count = end - start + 80
+    padding = -bit_count % 8
+    stream = b"BZh" + bytes([level]) + (bits << padding).to_bytes((bit_count + padding) // 8, "big")
+    try:
+        return block, bz2.decompress(stream)
+    except (OSError, ValueError):
+        return block, None
+
+
+def _bz2_parallel_chunks(filename, workers):
+    """
+    Decompressed content of bz2 file, decompressed block by block in a pool of threads (bz2 releases GIL);
+    if the magic number of a block appears by chance inside another block, both parts are decompressed together
+    """
+    with open(filename, "rb") as infile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            return
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data, ThreadPoolExecutor(workers) as executor:
+            merged = None
+            for block, content in _executor_map(executor, _decompress_bz2_block, _bz2_blocks(data), 2 * workers, data):
+                if merged is not None:
+                    if merged[3] != block[0]:
+                        raise OSError("Invalid data stream")
+                    merged = merged[:3] + (block[3],)
+                    _, content = _decompress_bz2_block(merged, data)
+                    if content is None:
+                        continue
+                    merged = None
+                elif content is None:
+                    merged = block
+                    continue
+                yield content
+            if merged is not None:
+                raise OSError("Invalid data stream")
+
+
+@lru_cache(maxsize=256)
+def _compressed_len_cached(path, inode, size, mtime_ns, fmt, workers):
+    count, last = 0, b"\n"
+    for chunk in _decompressed_chunks(path, fmt, workers):
+        count += chunk.count(b"\n")
+        last = chunk or last
+    return count + (not last.endswith(b"\n"))
+
+
+def _decompressed_chunks(filename, fmt, workers=None):
+    if fmt == "bz2" and workers is not None and workers > 1:
+        return _bz2_parallel_chunks(filename, workers)
+    return _read_chunks(_FORMATS.get(fmt, open), filename)
+
+
+def _compressed_cat(filename, fmt, with_len, workers, encoding):
+    filename = _to_absolute(filename)
+    encoding = encoding or locale.getpreferredencoding(False)
     if with_len:
-        with bz2.open(filename, 'rt') as infile:
-            len_ = max(i for i, _ in enumerate(infile)) + 1
+        stat = os.stat(filename)
+        len_ = _compressed_len_cached(str(filename), stat.st_ino, stat.st_size, stat.st_mtime_ns, fmt, workers)
     else:
         len_ = None
-    filename = _to_absolute(filename)
+    return generator(_lines(_decompressed_chunks(filename, fmt, workers), encoding), len_=len_)
 
-    def inner():
-        with bz2.open(filename, 'rt') as infile:
-            for line in infile:
-                yield line[:-1]
 
-    return generator(inner(), len_=len_)
+def bz2_cat(filename, with_len=False, workers=None, encoding=None):
+    """
+    Generates all content from given bz2 file line by line, stripping newline characters
+    With workers > 1 the blocks of the file are located and decompressed in parallel by that many threads
+    (like pbzip2, but also for files created by bzip2); with_len counts the lines (in the same way)
+    when the file is opened for the first time since it was modified
+    """
+    return _compressed_cat(filename, "bz2", with_len, workers, encoding)
+
+
+def gz_cat(filename, with_len=False, encoding=None):
+    """Generates all content from given gzip file line by line, stripping newline characters"""
+    return _compressed_cat(filename, "gz", with_len, None, encoding)
+
+
+def xz_cat(filename, with_len=False, encoding=None):
+    """Generates all content from given xz (or lzma) file line by line, stripping newline characters"""
+    return _compressed_cat(filename, "xz", with_len, None, encoding)
+
+
+def zcat(filename, with_len=False, workers=None, encoding=None):
+    """
+    Generates all content from given file line by line, stripping newline characters;
+    the file is decompressed if it is bz2, gzip or xz file (recognized by its content, not name)
+    workers are used to decompress bz2 files in parallel, as in bz2_cat
+    """
+    return _compressed_cat(filename, _detect_format(_to_absolute(filename)), with_len, workers, encoding)
+
+
+@make_source
+def sh(command, encoding="utf-8", raise_on_error=True, max_stderr=64 * 1024):
+    """
+    Runs given shell command and generates its output line by line, stripping newline characters,
+    as the command produces it (unlike run_command, which waits for the whole output)
+    Only the last max_stderr bytes of stderr are retained; they are included in CommandError,
+    raised after the output ends if the command returned non-zero exit code (unless raise_on_error is False)
+    If the pipeline stops consuming the output early, the command is killed
+    """
+    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               start_new_session=True)
+    stderr = _TailReader(process.stderr, max_stderr)
+    stdout = io.TextIOWrapper(process.stdout, encoding=encoding, newline="\n")
+    try:
+        for line in stdout:
+            yield _strip_newline(line)
+        returncode = process.wait()
+        if returncode != 0 and raise_on_error:
+            raise CommandError('Command returned {} exit code. Stderr:\n{}'.format(returncode, stderr.result(encoding)))
+    finally:
+        if process.poll() is None:
+            _kill_command(process)
+            process.wait()
+        stderr.result()  # the reader closes stderr itself
+        stdout.close()
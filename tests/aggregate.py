@@ -0,0 +1,96 @@
+import random
+import unittest
+from collections import Counter
+
+from pysh import cat_list, group_by, count_by, dedup, uniq, to_list, Flags
+from pysh.main import _read_run
+
+
+class AggregateTest(unittest.TestCase):
+
+    def test_count_by(self):
+        words = "a b a c b a".split()
+        self.assertEqual(sorted(cat_list(words) | count_by()), [('a', 3), ('b', 2), ('c', 1)])
+        self.assertEqual(sorted(cat_list(words + ['A']) | count_by(str.upper)), [('A', 4), ('B', 2), ('C', 1)])
+        self.assertEqual([] | count_by() | to_list(), [])
+        random.seed(0)
+        numbers = [random.randint(0, 999) for _ in range(20000)]
+        self.assertEqual(dict(numbers | count_by(max_keys=50)), Counter(numbers))
+
+    def test_group_by(self):
+        rows = [("a", 3), ("b", 1), ("a", 5), ("c", 2), ("b", 4)]
+        self.assertEqual(sorted(rows | group_by(lambda row: row[0], "sum", value=lambda row: row[1])),
+                         [('a', 8), ('b', 5), ('c', 2)])
+        self.assertEqual(sorted(rows | group_by(lambda row: row[0], ["count", "min", "max", "mean"],
+                                                value=lambda row: row[1], max_keys=1)),
+                         [('a', (2, 3, 5, 4.0)), ('b', (2, 1, 4, 2.5)), ('c', (1, 2, 2, 2.0))])
+        self.assertEqual(sorted(range(10) | group_by(lambda x: x % 3, "max")), [(0, 9), (1, 7), (2, 8)])
+        random.seed(0)
+        numbers = [random.randint(0, 999) for _ in range(20000)]
+        expected = {}
+        for n in numbers:
+            expected.setdefault(n % 300, []).append(n)
+        self.assertEqual(dict(numbers | group_by(lambda x: x % 300, "mean", max_keys=20)),
+                         {k: sum(v) / len(v) for k, v in expected.items()})
+        with self.assertRaises(ValueError):
+            group_by(agg="median")
+
+    def test_group_by_memory(self):
+        sizes = []
+
+        class checked_group_by(group_by):
+            def _merged_tables(self, partition, depth):
+                for table in super()._merged_tables(partition, depth):
+                    sizes.append(len(table))
+                    yield table
+
+        numbers = list(range(5000)) * 2
+        self.assertEqual(dict(numbers | checked_group_by(lambda x: x, "sum", max_keys=50)),
+                         {n: 2 * n for n in range(5000)})
+        self.assertGreater(len(sizes), 5000 // 50)
+        self.assertLessEqual(max(sizes), 50)
+        self.assertEqual(dict([-1, -2, -1] | group_by(max_keys=1)), {-1: 2, -2: 1})  # -1 and -2 have the same hash
+
+    def test_dedup(self):
+        words = "b a b c a d b".split()
+        self.assertEqual(list(cat_list(words) | dedup()), ['b', 'a', 'c', 'd'])
+        self.assertEqual(list(cat_list(words + ['B']) | dedup(str.upper)), ['b', 'a', 'c', 'd'])
+        self.assertEqual([] | dedup() | to_list(), [])
+        self.assertEqual(list(cat_list(words) | uniq(Flags.G)), ['b', 'a', 'c', 'd'])
+        random.seed(0)
+        numbers = [random.randint(0, 999) for _ in range(20000)]
+        expected = list(dict.fromkeys(numbers))
+        self.assertEqual(list(numbers | dedup(max_keys=50)), expected)
+        approximate = list(numbers | dedup(false_positive_rate=0.01, capacity=1000))
+        self.assertEqual(approximate, [n for n in expected if n in set(approximate)])
+        self.assertGreater(len(approximate), 0.95 * len(expected))
+
+    def test_dedup_equality(self):
+        mixed = ['a', b'a', 1, 1.0, True, (1,), (1.0,)]
+        self.assertEqual(list(mixed | dedup()), ['a', b'a', 1, (1,)])
+        self.assertEqual(list(mixed | dedup(max_keys=1)), ['a', b'a', 1, (1,)])
+        self.assertEqual(list(mixed | dedup(false_positive_rate=0.001, capacity=100)), ['a', b'a', 1, (1,), (1.0,)])
+        rows = [{"x": 1, "y": 2}, {"y": 2, "x": 1}, {"x": 2, "y": 2}]
+        by_items = lambda row: frozenset(row.items())
+        self.assertEqual(list(rows | dedup(by_items)), [rows[0], rows[2]])
+        self.assertEqual(list(rows | dedup(by_items, max_keys=1)), [rows[0], rows[2]])
+        self.assertEqual(list([-1, -2, -1, -2] | dedup(max_keys=1)), [-1, -2])  # -1 and -2 have the same hash
+
+    def test_dedup_memory(self):
+        sizes = []
+
+        class checked_dedup(dedup):
+            def _first_runs(self, partition, depth):
+                for run in super()._first_runs(partition, depth):
+                    sizes.append(sum(1 for _ in _read_run(run)))
+                    yield run
+
+        numbers = list(range(5000)) * 2
+        self.assertEqual(list(numbers | checked_dedup(max_keys=50)), list(range(5000)))
+        self.assertGreater(len(sizes), 5000 // 50)
+        self.assertLessEqual(max(sizes), 50)
+
+    def test_uniq_global_count(self):
+        words = "b a b c a d b".split()
+        self.assertEqual(list(cat_list(words) | uniq(Flags.G | Flags.C)), [('b', 3), ('a', 2), ('c', 1), ('d', 1)])
+        self.assertEqual(list([] | uniq(Flags.G | Flags.C)), [])
@@ -1,12 +1,19 @@
 import unittest
 
+from .aggregate import AggregateTest
+from .async_generator import AsyncGeneratorTest
+from .diff_engine import DiffEngineTest
 from .drains import DrainsTest
 from .file_utils import FileUtilsTest
 from .generator import GeneratorTest
 from .main import PyshTest
+from .parallel import ParallelTest
+from .regex_engine import RegexEngineTest
+from .sketches import SketchesTest
 from .sources import SourcesTest
 
-ALL_TEST = [SourcesTest, DrainsTest, FileUtilsTest, GeneratorTest, PyshTest]  # to stop PyCharm from removing imports
+ALL_TEST = [SourcesTest, DrainsTest, FileUtilsTest, GeneratorTest, PyshTest, ParallelTest, AsyncGeneratorTest,
+            RegexEngineTest, AggregateTest, SketchesTest, DiffEngineTest]  # to stop PyCharm from removing imports
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,70 @@
+import asyncio
+import unittest
+
+from pysh import (AsyncGenerator, make_async_source, make_async_pipe, make_async_drain, async_cat, async_sh,
+                  cat_list, grep, to_list, head, rm, sh, CommandError)
+
+
+@make_async_source
+async def countdown(n):
+    while n:
+        await asyncio.sleep(0)
+        yield n
+        n -= 1
+
+
+@make_async_pipe
+async def doubled(source):
+    async for elem in source:
+        yield elem
+        yield elem
+
+
+@make_async_drain
+async def collect(source):
+    return [elem async for elem in source]
+
+
+async def negate(x):
+    await asyncio.sleep(0)
+    return -x
+
+
+class AsyncGeneratorTest(unittest.TestCase):
+
+    def setUp(self):
+        with open("/tmp/pysh_cat_test", "w") as outfile:
+            outfile.write("a\nb\ncde\nbde\n\n")
+
+    def tearDown(self) -> None:
+        rm("/tmp/pysh_cat_test")
+
+    def test_async_pipes(self):
+        async def run():
+            self.assertEqual([x async for x in countdown(3)], [3, 2, 1])
+            self.assertEqual(await (countdown(3) | doubled() | collect()), [3, 3, 2, 2, 1, 1])
+            self.assertEqual(await (countdown(3) | to_list()), [3, 2, 1])
+            self.assertEqual(await (countdown(5) | (lambda x: x * 10) | head(2) | to_list()), [50, 40])
+            self.assertEqual(await (countdown(3) | negate | collect()), [-3, -2, -1])
+            self.assertEqual(await (countdown(12) | str | grep("1") | doubled() | to_list()),
+                             ['12', '12', '11', '11', '10', '10', '1', '1'])
+            self.assertEqual(await (cat_list(['ab', 'b', 'ac']) | doubled() | grep('a') | collect()),
+                             ['ab', 'ab', 'ac', 'ac'])
+            self.assertEqual([x async for x in AsyncGenerator(range(3))], [0, 1, 2])
+
+        asyncio.run(run())
+
+    def test_async_sources(self):
+        async def run():
+            self.assertEqual(await (async_cat("/tmp/pysh_cat_test") | grep("b") | collect()), ["b", "bde"])
+            results = await asyncio.gather(*(async_sh("printf 'x\\ny{}\\n'".format(i)) | to_list() for i in range(20)))
+            self.assertEqual(results, [['x', 'y{}'.format(i)] for i in range(20)])
+            self.assertEqual(await (async_sh("yes") | head(3) | to_list()), ['y', 'y', 'y'])
+            command = "printf 'a\\r\\nb\\rc\\n'"
+            self.assertEqual(await (async_sh(command) | to_list()), sh(command) | to_list())
+            command = "head -c 200000 /dev/zero | tr '\\0' x; printf '\\ny'"  # longer than the stream's limit
+            self.assertEqual(await (async_sh(command) | to_list()), ['x' * 200000, 'y'])
+            with self.assertRaises(CommandError):
+                await (async_sh("echo a; exit 3") | collect())
+
+        asyncio.run(run())
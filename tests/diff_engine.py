@@ -0,0 +1,57 @@
+import random
+import unittest
+
+from pysh import diff_engine
+
+
+def apply_opcodes(ops):
+    result = []
+    for tag, _, _, _, _, lines1, lines2 in ops:
+        result += lines1 if tag == "equal" else lines2
+    return result
+
+
+class DiffEngineTest(unittest.TestCase):
+
+    def test_opcodes(self):
+        self.assertEqual([op[:5] for op in diff_engine.opcodes(list("axbc"), list("abyc"))],
+                         [('equal', 0, 1, 0, 1), ('delete', 1, 2, 1, 1), ('equal', 2, 3, 1, 2), ('insert', 3, 3, 2, 3),
+                          ('equal', 3, 4, 3, 4)])
+        self.assertEqual(list(diff_engine.opcodes([], [])), [])
+        random.seed(0)
+        for _ in range(300):
+            seq1 = [random.choice("abcde") for _ in range(random.randint(0, 30))]
+            seq2 = [random.choice("abcde") for _ in range(random.randint(0, 30))]
+            ops = list(diff_engine.opcodes(seq1, seq2))
+            self.assertEqual(apply_opcodes(ops), seq2)
+            self.assertEqual([(op[1], op[3]) for op in ops[1:]], [(op[2], op[4]) for op in ops[:-1]])
+            self.assertEqual(apply_opcodes(diff_engine.window_opcodes(iter(seq1), iter(seq2), 7)), seq2)
+
+    def test_moved_block(self):
+        seq1 = ["line {}".format(i) for i in range(1000)]
+        seq2 = seq1[600:] + seq1[:600]
+        ops = list(diff_engine.opcodes(seq1, seq2))
+        self.assertEqual([op[:5] for op in ops], [('insert', 0, 0, 0, 400), ('equal', 0, 600, 400, 1000),
+                                                  ('delete', 600, 1000, 1000, 1000)])
+
+    def test_repetitive_lines(self):
+        random.seed(0)
+        seq1 = [random.choice("xy") for _ in range(20000)]
+        seq2 = [random.choice("xy") for _ in range(20000)]
+        ops = list(diff_engine.opcodes(seq1, seq2))
+        self.assertEqual(apply_opcodes(ops), seq2)
+        changed = sum(i2 - i1 + j2 - j1 for tag, i1, i2, j1, j2, _, _ in ops if tag != "equal")
+        self.assertLess(changed, 10000)  # about 8500, nowhere near everything replaced
+        seq1 = list("ab" * 300)
+        seq2 = seq1[:200] + list("ba" * 50) + seq1[300:]
+        ops = [op for op in diff_engine.opcodes(seq1, seq2) if op[0] != "equal"]
+        self.assertEqual(sum(op[2] - op[1] + op[4] - op[3] for op in ops), 2)
+
+    def test_hunks(self):
+        seq1 = [str(i) for i in range(20)]
+        seq2 = seq1[:2] + ["x"] + seq1[3:15] + seq1[16:]
+        hunks = list(diff_engine.hunks(diff_engine.opcodes(seq1, seq2), 2))
+        self.assertEqual([[op[:5] for op in hunk] for hunk in hunks],
+                         [[('equal', 0, 2, 0, 2), ('replace', 2, 3, 2, 3), ('equal', 3, 5, 3, 5)],
+                          [('equal', 13, 15, 13, 15), ('delete', 15, 16, 15, 15), ('equal', 16, 18, 15, 17)]])
+        self.assertEqual(list(diff_engine.hunks(diff_engine.opcodes(seq1, seq1), 3)), [])
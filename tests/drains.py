@@ -1,6 +1,10 @@
+import bz2
+import gzip
+import lzma
+import os
 import unittest
 
-from pysh import cat_list, to_file, cat, mkdir, rm, Flags, head, to_list, echo
+from pysh import cat_list, to_file, cat, mkdir, rm, Flags, head, to_list, echo, to_bz2, to_gz, to_xz, zcat
 
 
 class DrainsTest(unittest.TestCase):
@@ -14,6 +18,46 @@ class DrainsTest(unittest.TestCase):
         cat_list(['a', 'b', 'c', 'd', 'efgh', 'x']) | to_file("/tmp/pysh_test/file_saver_test")
         content = list(cat("/tmp/pysh_test/file_saver_test"))
         self.assertEqual(content, ['a', 'b', 'c', 'd', 'efgh', 'x'])
+        cat_list(['a', 'b', 'c', 'd', 'efgh', 'x']) | str.upper | to_file("/tmp/pysh_test/file_saver_test", batch_size=4)
+        content = list(cat("/tmp/pysh_test/file_saver_test"))
+        self.assertEqual(content, ['A', 'B', 'C', 'D', 'EFGH', 'X'])
+        cat_list([b'a\n', b'bc\n']) | to_file("/tmp/pysh_test/file_saver_test", mode="ab")
+        self.assertEqual(cat("/tmp/pysh_test/file_saver_test") | to_list(), ['A', 'B', 'C', 'D', 'EFGH', 'X', 'a', 'bc'])
+
+    def test_file_saver_atomic(self):
+        fname = "/tmp/pysh_test/atomic_test"
+        cat_list(['a', 'b']) | to_file(fname)
+        os.chmod(fname, 0o640)
+        range(3) | to_file(fname, atomic=True, fsync="close", batch_size=2)
+        self.assertEqual(cat(fname) | to_list(), ['0', '1', '2'])
+        self.assertEqual(os.stat(fname).st_mode & 0o777, 0o640)
+
+        def failing():
+            yield "x"
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            failing() | to_file(fname, atomic=True, fsync="batch", batch_size=1)
+        self.assertEqual(cat(fname) | to_list(), ['0', '1', '2'])  # the file is left unchanged
+        self.assertEqual(os.listdir("/tmp/pysh_test"), ["atomic_test"])  # and the temporary one is removed
+        with self.assertRaises(ValueError):
+            range(3) | to_file(fname, mode="a", atomic=True)
+        with self.assertRaises(ValueError):
+            range(3) | to_file(fname, fsync="always")
+
+    def test_compressed_drains(self):
+        content = ["{} line ąę".format(i) for i in range(20000)]
+        data = ("\n".join(content) + "\n").encode()
+        for drain, module in [(to_bz2, bz2), (to_gz, gzip), (to_xz, lzma)]:
+            fname = "/tmp/pysh_test/compressed_test"
+            cat_list(content) | drain(fname, encoding="utf-8")
+            self.assertEqual(zcat(fname, encoding="utf-8") | to_list(), content)
+            cat_list(content) | drain(fname, workers=3, level=1, block_size=50000, encoding="utf-8")
+            with open(fname, "rb") as infile:
+                self.assertEqual(module.decompress(infile.read()), data)
+            cat_list([b"ab", b"c\n"]) | drain(fname, mode="ab", workers=2)
+            with open(fname, "rb") as infile:
+                self.assertEqual(module.decompress(infile.read()), data + b"abc\n")
 
     def test_to_list(self):
         self.assertEqual([1, 2, 3] | head(2) | to_list(), [1, 2])
@@ -27,3 +71,6 @@ class DrainsTest(unittest.TestCase):
         with open("/tmp/pysh_test/echo_test", "w") as outfile:
             (i ** 2 for i in range(5)) | echo(out=outfile)
         self.assertEqual(cat("/tmp/pysh_test/echo_test") | to_list(), ['0', '1', '4', '9', '16'])
+        with open("/tmp/pysh_test/echo_test", "w") as outfile:
+            range(5) | echo(out=outfile, batch_size=2)
+        self.assertEqual(cat("/tmp/pysh_test/echo_test") | to_list(), ['0', '1', '2', '3', '4'])
@@ -1,3 +1,4 @@
+import os
 import re
 import re
 import unittest
@@ -5,7 +6,7 @@ from random import choice
 from string import ascii_lowercase
 
 from pysh import cd, pwd, find, ls, rm, mkdir, touch, Flags, cat, to_list, cat_list, to_file, mv
-from pysh.file_utils import cp, du
+from pysh.file_utils import cp, du, diff_tree
 
 
 class FileUtilsTest(unittest.TestCase):
@@ -181,4 +182,42 @@ class FileUtilsTest(unittest.TestCase):
         cat_list([''.join([choice(ascii_lowercase) for _ in range(9876)])]) | to_file('/tmp/pysh_test/du_test')
         self.assertEqual(du('/tmp/pysh_test/du_test'), 9877)
 
+    def test_diff_tree(self):
+        for tree in ("/tmp/pysh_test/tree1", "/tmp/pysh_test/tree2"):
+            mkdir(tree + "/same_dir/inner")
+            cat_list(["a", "b", "c"]) | to_file(tree + "/same_dir/inner/same")
+            cat_list(["x"] * 100) | to_file(tree + "/same_size")
+        mkdir("/tmp/pysh_test/tree1/removed_dir/inner")
+        touch("/tmp/pysh_test/tree1/removed")
+        touch("/tmp/pysh_test/tree2/added")
+        cat_list(["a", "b"]) | to_file("/tmp/pysh_test/tree1/same_dir/resized")
+        cat_list(["a", "b", "c"]) | to_file("/tmp/pysh_test/tree2/same_dir/resized")
+        cat_list(["x"] * 99 + ["y"]) | to_file("/tmp/pysh_test/tree2/same_size")
+        with open("/tmp/pysh_test/tree1/binary", "wb") as outfile:
+            outfile.write(b"\0\1")
+        with open("/tmp/pysh_test/tree2/binary", "wb") as outfile:
+            outfile.write(b"\0\2")
+        mkdir("/tmp/pysh_test/tree1/dir_or_file")
+        touch("/tmp/pysh_test/tree2/dir_or_file")
+        os.symlink("missing1", "/tmp/pysh_test/tree1/dangling")
+        os.symlink("missing2", "/tmp/pysh_test/tree2/dangling")
+        expected = {('changed', 'binary'), ('removed', 'removed'), ('added', 'added'),
+                    ('removed', 'removed_dir'), ('changed', 'same_dir/resized'), ('changed', 'same_size'),
+                    ('changed', 'dir_or_file'), ('changed', 'dangling')}
+        self.assertEqual(set(diff_tree("/tmp/pysh_test/tree1", "/tmp/pysh_test/tree2", workers=2)), expected)
+        with cd("/tmp/pysh_test"):
+            self.assertEqual(list(diff_tree("tree1", "tree1")), [])
+        changes = {path: lines for _, path, lines in diff_tree("/tmp/pysh_test/tree1", "/tmp/pysh_test/tree2",
+                                                                line_diffs="unified")}
+        self.assertEqual(list(changes["same_dir/resized"]),
+                         ['--- a/same_dir/resized', '+++ b/same_dir/resized', '@@ -1,2 +1,3 @@', ' a', ' b', '+c'])
+        self.assertIsNone(changes["binary"])
+        self.assertIsNone(changes["added"])
+        self.assertIsNone(changes["dir_or_file"])
+        self.assertIsNone(changes["dangling"])
+        os.utime("/tmp/pysh_test/tree2/same_size", ns=(0, os.stat("/tmp/pysh_test/tree1/same_size").st_mtime_ns))
+        self.assertNotIn(('changed', 'same_size'), set(diff_tree("/tmp/pysh_test/tree1", "/tmp/pysh_test/tree2")))
+        self.assertIn(('changed', 'same_size'),
+                      set(diff_tree("/tmp/pysh_test/tree1", "/tmp/pysh_test/tree2", shallow=False)))
+
 # TODO: df?
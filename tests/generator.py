@@ -1,6 +1,9 @@
+import importlib
 import unittest
 
-from pysh import pipe_from_func, cat_list, make_pipe, make_drain, tail, head, to_list, make_source, split_sequence
+from pysh import (pipe_from_func, cat_list, make_pipe, make_drain, tail, head, to_list, make_source, split_sequence,
+                  batched, unbatched, grep, sed, rev, cut, Flags)
+from pysh.generator import FusedPipe
 
 
 class GeneratorTest(unittest.TestCase):
@@ -92,3 +95,45 @@ class GeneratorTest(unittest.TestCase):
         self.assertEqual(list(next(split_gens)), list(range(6, 8)))
         with self.assertRaises(StopIteration):
             next(split_gens)
+
+    def test_batches(self):
+        self.assertEqual(list(range(7) | batched(3)), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(range(7) | batched(3) | unbatched()), list(range(7)))
+
+        lines = ['abc {}'.format(i) for i in range(100)]
+        expected = list(cat_list(lines) | grep("1") | sed('s', 'b', 'X') | rev() | str.upper | cut(2))
+        result = list(cat_list(lines) | grep("1") | sed('s', 'b', 'X') | rev() | str.upper | cut(2) | batched(8))
+        self.assertTrue(all(len(batch) <= 8 for batch in result))
+        self.assertEqual([elem for batch in result for elem in batch], expected)
+
+        @make_pipe
+        def duplicate(source):
+            for elem in source:
+                yield elem
+                yield elem
+
+        result = list(lines | grep("7", Flags.V) | duplicate() | rev() | batched(10) | unbatched() | rev() | batched(5))
+        self.assertEqual([elem for batch in result for elem in batch],
+                         [line for line in lines if "7" not in line for _ in range(2)])
+        result = list(lines | grep("5", Flags.N) | batched(3) | unbatched())
+        self.assertEqual(result, [(i, line) for i, line in enumerate(lines) if "5" in line])
+
+    def test_fusion(self):
+        lines = [' Abc {} '.format(i) for i in range(50)]
+        pipe = cat_list(lines) | str.strip | str.lower | grep("1") | rev() | sed('y', 'cba', 'XYZ')
+        self.assertIsInstance(pipe, FusedPipe)
+        expected = [line.strip().lower()[::-1].replace('c', 'X').replace('b', 'Y').replace('a', 'Z')
+                    for line in lines if '1' in line]
+        self.assertEqual(list(pipe), expected)
+        pipe = cat_list(lines) | str.strip | str.lower | grep("1") | rev() | sed('y', 'cba', 'XYZ') | batched(4)
+        self.assertEqual([elem for batch in pipe for elem in batch], expected)
+        self.assertEqual(list(cat_list(['a1', 'b2', 'a3']) | grep("a", Flags.N) | (lambda x: x[1])), ['a1', 'a3'])
+
+        generator_module = importlib.import_module("pysh.generator")
+        generator_module.FUSE_PIPES = False
+        try:
+            pipe = cat_list(lines) | str.strip | str.lower | grep("1") | rev() | sed('y', 'cba', 'XYZ')
+            self.assertNotIsInstance(pipe, FusedPipe)
+            self.assertEqual(list(pipe), expected)
+        finally:
+            generator_module.FUSE_PIPES = True
@@ -1,5 +1,11 @@
 import re
+import subprocess
+import sys
 import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import pysh.main
 
 from pysh import *
 
@@ -35,6 +41,66 @@ class PyshTest(unittest.TestCase):
         result = list(cat_list(['abc', 'cde', 'bCd', 'bof', 'xxx', 'BCD']) | grep("Bc", Flags.N | Flags.I, start_num=1))
         self.assertEqual(result, [(1, "abc"), (3, "bCd"), (6, "BCD")])
 
+    def test_grep_fixed(self):
+        lst = ['a.c', 'abc', 'x(y', 'A.C', 'xyz']
+        self.assertEqual(list(cat_list(lst) | grep("a.c", Flags.F)), ['a.c'])
+        self.assertEqual(list(cat_list(lst) | grep("a.c", Flags.F | Flags.I)), ['a.c', 'A.C'])
+        self.assertEqual(list(cat_list(lst) | grep("x(", Flags.F | Flags.V)), ['a.c', 'abc', 'A.C', 'xyz'])
+        self.assertEqual(list(cat_list(lst) | grep(["bc", "(", "no"], Flags.F)), ['abc', 'x(y'])
+        self.assertEqual(list(cat_list(lst) | grep(["BC", "A.C", "yz"], Flags.F | Flags.I | Flags.N)),
+                         [(0, 'a.c'), (1, 'abc'), (3, 'A.C'), (4, 'xyz')])
+        self.assertEqual(list(cat_list(lst) | grep(["a.", "x"])), ['a.c', 'abc', 'x(y', 'xyz'])
+        self.assertEqual(list(cat_list(lst) | grep([], Flags.F)), [])
+        indicators = ["{:x}.example.com".format(i * 7919) for i in range(1000)]
+        lines = ["GET http://{}/index".format(ind) for ind in indicators[::100]] + ["GET http://example.com/"]
+        with open("/tmp/pysh_grep_patterns", "w") as outfile:
+            outfile.write("\n".join(indicators))
+        self.assertEqual(list(cat_list(lines) | grep(flags=Flags.F | Flags.V, patterns_file="/tmp/pysh_grep_patterns")),
+                         ["GET http://example.com/"])
+        rm("/tmp/pysh_grep_patterns")
+
+    def test_grep_files(self):
+        mkdir("/tmp/pysh_grep_dir")
+        mkdir("/tmp/pysh_grep_dir/sub")
+        with open("/tmp/pysh_grep_dir/a.txt", "w") as outfile:
+            outfile.write("foo\nbar\r\nbaz foo\nx")
+        with open("/tmp/pysh_grep_dir/sub/b.txt", "w") as outfile:
+            outfile.write("nothing\nFOO here\n")
+        with open("/tmp/pysh_grep_dir/c.bin", "wb") as outfile:
+            outfile.write(b"foo\0")
+        touch("/tmp/pysh_grep_dir/empty")
+        a_file, b_file = "/tmp/pysh_grep_dir/a.txt", "/tmp/pysh_grep_dir/sub/b.txt"
+        for mmap_min_size in [0, pysh.main._MMAP_MIN_SIZE]:
+            with patch("pysh.main._MMAP_MIN_SIZE", mmap_min_size):
+                self.assertEqual(list(grep("foo", files=a_file)), ["foo", "baz foo"])
+                self.assertEqual(list(grep("^ba", Flags.N, files=a_file, start_num=1)), [(2, "bar"), (3, "baz foo")])
+                self.assertEqual(list(grep("foo", Flags.V | Flags.N, files=a_file)), [(1, "bar"), (3, "x")])
+                self.assertEqual(list(grep(["baz", "x"], Flags.F | Flags.V, files=a_file)), ["foo", "bar"])
+        self.assertEqual(sorted(grep("foo", Flags.I, files="/tmp/pysh_grep_dir", recursive=True)),
+                         [(a_file, "baz foo"), (a_file, "foo"), (b_file, "FOO here")])
+        self.assertEqual(list(grep("o|e", Flags.N, files=[a_file, b_file], workers=1)),
+                         [(a_file, 0, "foo"), (a_file, 2, "baz foo"), (b_file, 0, "nothing"), (b_file, 1, "FOO here")])
+        self.assertEqual(sorted(grep("here", Flags.F, files="/tmp/pysh_grep_dir", recursive=True, workers=2)),
+                         [(b_file, "FOO here")])
+        rm("/tmp/pysh_grep_dir", Flags.R)
+
+    def test_grep_files_as_lines(self):
+        contents = ["foo\nbar\r\nfoo \nfoobar\n\nxfoo\n", "\u0119\nfoo\nbar\r\n\u0105 foo\n\u0119\u0119\n"]
+        patterns = ["x*", "[\u0105]", "^.$", "bar$", r"foo\s", r"\Afoo", "o(?!o)", "^$", "foo"]
+        for content in contents:
+            cat_list([content]) | to_file("/tmp/pysh_grep_lines", mode="w")
+            for block_size in [4, pysh.main._SEARCH_BLOCK_SIZE]:
+                with patch("pysh.main._SEARCH_BLOCK_SIZE", block_size):
+                    for pattern in patterns:
+                        for flags in [Flags.N, Flags.N | Flags.V]:
+                            self.assertEqual(list(grep(pattern, flags, files="/tmp/pysh_grep_lines", workers=1)),
+                                             list(cat("/tmp/pysh_grep_lines") | grep(pattern, flags)),
+                                             (content, pattern, flags, block_size))
+        with open("/tmp/pysh_grep_lines", "w") as outfile:
+            outfile.write("a\nb\n")
+        self.assertEqual(list(grep("x*", files="/tmp/pysh_grep_lines", workers=1)), ["a", "b"])
+        rm("/tmp/pysh_grep_lines")
+
     def test_uniq(self):
         result = list(cat_list(['a', 'a', 'b', 'b', 'b', 'c', 'd', 'ee', 'ee', 'ee', 'f', 'ff', 'a']) | uniq())
         self.assertEqual(result, ['a', 'b', 'c', 'd', 'ee', 'f', 'ff', 'a'])
@@ -60,6 +126,37 @@ class PyshTest(unittest.TestCase):
         result = list(['3 K', ' 1G', '2 M'] | sort(Flags.H))
         self.assertEqual(result, ['3 K', '2 M', ' 1G'])
 
+    def test_sort_max_memory(self):
+        data = ['{} line'.format((i * 7919) % 1000) for i in range(1000)]
+        self.assertEqual(list(data | sort(max_memory=2000)), sorted(data))
+        self.assertEqual(list(data | sort(Flags.G, max_memory=2000)), list(data | sort(Flags.G)))
+        self.assertEqual(list(data | sort(Flags.H | Flags.R, max_memory=2000)), list(data | sort(Flags.H | Flags.R)))
+        self.assertEqual(list(['b', 'a'] | sort(max_memory=10 ** 6)), ['a', 'b'])
+        self.assertEqual(list([] | sort(max_memory=10)), [])
+
+    def test_sort_workers(self):
+        data = ['{}K line'.format((i * 7919) % 5000) for i in range(20000)]
+        self.assertEqual(list(data | sort(workers=2)), sorted(data))
+        self.assertEqual(list(data | sort(Flags.G, workers=3)), list(data | sort(Flags.G)))
+        self.assertEqual(list(data | sort(Flags.H | Flags.R, workers=2)), list(data | sort(Flags.H | Flags.R)))
+        self.assertEqual(list(data | sort(Flags.G, workers=2, max_memory=100000)), list(data | sort(Flags.G)))
+        self.assertEqual(list(['b', 'a'] | sort(workers=4)), ['a', 'b'])
+
+    def test_sort_keys(self):
+        data = ['b\t10\tx', 'a\t9\ty', 'b\t2\tz', 'a\t10\tw', 'c\t1K\tv', 'a\t9\tu']
+        self.assertEqual(list(data | sort(keys="2,2n", delimiter="\t")),
+                         ['c\t1K\tv', 'b\t2\tz', 'a\t9\ty', 'a\t9\tu', 'b\t10\tx', 'a\t10\tw'])
+        self.assertEqual(list(data | sort(keys="2,2h", delimiter="\t"))[-1], 'c\t1K\tv')
+        self.assertEqual(list(data | sort(keys=["1,1", "2,2nr"], delimiter="\t")),
+                         ['a\t10\tw', 'a\t9\ty', 'a\t9\tu', 'b\t10\tx', 'b\t2\tz', 'c\t1K\tv'])
+        self.assertEqual(list(data | sort(Flags.R, keys="1,1", delimiter="\t")),
+                         ['c\t1K\tv', 'b\t10\tx', 'b\t2\tz', 'a\t9\ty', 'a\t10\tw', 'a\t9\tu'])
+        self.assertEqual(list(['x 3 b', 'y 1 c', 'z 3 a'] | sort(keys=2)), ['y 1 c', 'z 3 a', 'x 3 b'])
+        self.assertEqual(list(data | sort(keys=["1,1r", "2,2n"], delimiter="\t", max_memory=100)),
+                         list(data | sort(keys=["1,1r", "2,2n"], delimiter="\t")))
+        with self.assertRaises(ValueError):
+            list(data | sort(keys="0,1"))
+
     def test_sed(self):
         self.assertEqual(list(cat_list(['aaaa', 'babab', 'cdcd']) | sed('y', 'abcd', 'XYZŹ')),
                          ['XXXX', 'YXYXY', 'ZŹZŹ'])
@@ -87,6 +184,46 @@ class PyshTest(unittest.TestCase):
         self.assertEqual(wc("/tmp/pysh_test/wc_test", Flags.L), (6,))
         self.assertEqual(wc("/tmp/pysh_test/wc_test", Flags.W | Flags.L), (7, 6))
         self.assertEqual(tuple(cat("/tmp/pysh_test/wc_test") | wc()), (11, 7, 6))
+        self.assertEqual(tuple(cat("/tmp/pysh_test/wc_test") | wc(Flags.L)), (6,))
+
+        with open("/tmp/pysh_test/wc_test", "a") as outfile:
+            outfile.write("ąę  ść\tlast line without newline")
+        self.assertEqual(wc("/tmp/pysh_test/wc_test", Flags.L), (7,))
+        self.assertEqual(tuple(wc("/tmp/pysh_test/wc_test")), (49, 13, 7))
+        block_size = pysh.main._WC_BLOCK_SIZE
+        pysh.main._WC_BLOCK_SIZE = 5
+        try:
+            with open("/tmp/pysh_test/wc_test2", "w") as outfile:
+                outfile.write("abc defgh ijk\nlmnopqrst   u\n\nvw")
+            self.assertEqual(tuple(wc("/tmp/pysh_test/wc_test2")), (31, 6, 4))
+            self.assertEqual(tuple(wc("/tmp/pysh_test/wc_test2", Flags.L)), (4,))
+            self.assertEqual(len(cat("/tmp/pysh_test/wc_test2", with_len=True)), 4)
+            with open("/tmp/pysh_test/wc_test3", "w", newline="") as outfile:
+                outfile.write("a\rb\r\nc\rd\ne")
+            lines = cat("/tmp/pysh_test/wc_test3", with_len=True)
+            self.assertEqual(len(lines), 3)
+            self.assertEqual(tuple(wc("/tmp/pysh_test/wc_test3")), (10, 5, 3))
+            self.assertEqual(list(lines), ['a\rb', 'c\rd', 'e'])
+        finally:
+            pysh.main._WC_BLOCK_SIZE = block_size
+
+    def test_merge(self):
+        self.assertEqual(merge(['a', 'c', 'e'], ['b', 'c'], [], ['d']) | to_list(), ['a', 'b', 'c', 'c', 'd', 'e'])
+        self.assertEqual(merge(['a', 'c', 'e'], ['b', 'c'], ['c', 'd'], unique=True) | to_list(), ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual(merge(['9', '10', '100'], ['2', '20'], flags=Flags.G) | to_list(), ['2', '9', '10', '20', '100'])
+        self.assertEqual(merge(['2K', '1'], ['1M', '3'], flags=Flags.H | Flags.R) | to_list(), ['1M', '2K', '3', '1'])
+        self.assertEqual(merge(['x 1', 'a 2'], ['b 1', 'c 3'], keys="2,2n") | to_list(), ['x 1', 'b 1', 'a 2', 'c 3'])
+        self.assertEqual(merge([1, -2], [-1, 3], key=abs, unique=True) | to_list(), [1, -2, 3])
+        cat_list(['a', 'd', 'f']) | to_file("/tmp/pysh_test/merge_test")
+        self.assertEqual(merge("/tmp/pysh_test/merge_test", cat_list(['b', 'e'])) | to_list(), ['a', 'b', 'd', 'e', 'f'])
+        with cd("/tmp/pysh_test"):
+            self.assertEqual(merge("merge_test", ['c']) | to_list(), ['a', 'c', 'd', 'f'])
+        merged = merge(['a', 'c', 'b'], ['x'] * 1000)
+        self.assertEqual(merged | head(2) | to_list(), ['a', 'c'])  # the order is validated lazily
+        with self.assertRaises(ValueError):
+            merged | to_list()
+        with self.assertRaises(ValueError):
+            merge(['1', '2'], ['3', '1'], flags=Flags.R) | to_list()
 
     def test_comm(self):
         result = list(comm(cat_list([1, 2, 4]), cat_list([1, 3, 4, 5])))
@@ -109,6 +246,55 @@ class PyshTest(unittest.TestCase):
         self.assertEqual(diff("abc", "abcd"), ['2a3', '> d'])
         self.assertEqual(diff("axbc", "abyc"), ['1d0', '< x', '2a2', '> y'])
 
+    def test_diff_formats(self):
+        seq1 = ["a", "b", "c", "d", "e", "f", "g", "h"]
+        seq2 = ["a", "B", "c", "d", "e", "f", "g", "h", "i"]
+        self.assertEqual(diff(seq1, seq2, output="unified", context=1, names=("old", "new")),
+                         ['--- old', '+++ new', '@@ -1,3 +1,3 @@', ' a', '-b', '+B', ' c', '@@ -8 +8,2 @@', ' h', '+i'])
+        self.assertEqual(diff(seq1, seq2, output="context", context=1),
+                         ['***************', '*** 1,3 ****', '  a', '! b', '  c', '--- 1,3 ----', '  a', '! B', '  c',
+                          '***************', '*** 8 ****', '--- 8,9 ----', '  h', '+ i'])
+        self.assertEqual(diff(seq1, seq2, output="unified", context=3),
+                         ['@@ -1,8 +1,9 @@', ' a', '-b', '+B', ' c', ' d', ' e', ' f', ' g', ' h', '+i'])
+        self.assertEqual(diff(seq1, seq1, output="unified"), [])
+        self.assertEqual(diff(seq1, seq1, output="unified", names=("old", "new")), [])
+        self.assertEqual(diff(seq1, seq1, output="context", names=("old", "new")), [])
+        self.assertEqual(diff(seq1, seq2, output="context", context=1, names=("old", "new"))[:3],
+                         ['*** old', '--- new', '***************'])
+        lines = ["line {}".format(i) for i in range(10000)]
+        changed = lines[:5000] + ["new"] + lines[5000:9000] + lines[9001:]
+        self.assertEqual(list(diff(iter(lines), iter(changed), start_num=1, window=1000)),
+                         ['5000a5001', '> new', '9001d9001', '< line 9000'])
+        self.assertEqual(list(diff(iter(lines), iter(changed), output="unified", window=1000)),
+                         diff(lines, changed, output="unified"))
+        with self.assertRaises(ValueError):
+            diff(seq1, seq2, output="html")
+
+    def test_cmd(self):
+        self.assertEqual(list(cat_list(['b', 'a', 'b', 'c']) | cmd("sort -u") | grep("[ab]")), ['a', 'b'])
+        self.assertEqual(list(range(10 ** 6) | cmd("head -3")), ['0', '1', '2'])
+        self.assertEqual(list(range(10 ** 5) | cmd("cat") | int | head(2)), [0, 1])
+        self.assertEqual(list(range(10 ** 5) | cmd("wc -l") | str.strip), ["100000"])
+        self.assertEqual(list(cat_list(["a\rb", "c"]) | cmd("cat")), ["a\rb", "c"])
+        self.assertEqual(list(cat_list(["a"]) | cmd("printf 'x\\r\\ny\\r'")), ["x", "y\r"])
+        with self.assertRaises(CommandError):
+            list(range(10) | cmd("cat; exit 2"))
+
+        def failing():
+            yield "a"
+            raise KeyError("upstream")
+
+        with self.assertRaises(KeyError):
+            list(failing() | cmd("cat"))
+
+    def test_cmd_at_exit(self):
+        # the generator stopped by head is closed only at interpreter shutdown, while stdin and stderr are still in use
+        script = "from pysh import cmd, head, to_list; print(range(10 ** 7) | cmd('cat') | head(3) | to_list())"
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, timeout=60,
+                                cwd=Path(__file__).parent.parent)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), b"['0', '1', '2']")
+
     def test_head(self):
         self.assertEqual(list(range(100) | head()), list(range(10)))
         self.assertEqual(list(range(100) | head(-10)), list(range(90)))
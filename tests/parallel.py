@@ -0,0 +1,83 @@
+import gc
+import json
+import threading
+import time
+import unittest
+
+from pysh import cat_list, pmap, to_list, head, batched, buffer, grep, tee, fork, wc, to_file, cat, rm, Flags
+
+
+def _square(x):
+    return x ** 2
+
+
+def _fail_on_13(x):
+    if x == 13:
+        raise ValueError("13")
+    return x
+
+
+class ParallelTest(unittest.TestCase):
+
+    def test_pmap(self):
+        self.assertEqual(range(1000) | pmap(_square, workers=2, chunksize=7) | to_list(), [x ** 2 for x in range(1000)])
+        result = range(1000) | pmap(_square, workers=3, chunksize=10, ordered=False) | to_list()
+        self.assertEqual(sorted(result), [x ** 2 for x in range(1000)])
+        lines = [json.dumps({"id": i}) for i in range(100)]
+        self.assertEqual(cat_list(lines) | pmap(json.loads, workers=2, chunksize=8) | (lambda d: d["id"]) | head(3)
+                         | to_list(), [0, 1, 2])
+        self.assertEqual(list(range(10) | pmap(_square, workers=2, chunksize=4) | batched(100)),
+                         [[0, 1, 4, 9], [16, 25, 36, 49], [64, 81]])
+        self.assertEqual([] | pmap(_square, workers=2) | to_list(), [])
+        with self.assertRaises(ValueError):
+            range(100) | pmap(_fail_on_13, workers=2, chunksize=5) | to_list()
+
+    def test_buffer(self):
+        self.assertEqual(range(10000) | buffer(maxsize=2, batch_size=100) | to_list(), list(range(10000)))
+        self.assertEqual(cat_list(['a1', 'b', 'a2']) | buffer() | grep('a') | to_list(), ['a1', 'a2'])
+        with self.assertRaises(ValueError):
+            (_fail_on_13(x) for x in range(100)) | buffer(batch_size=3) | to_list()
+
+        read = []
+
+        def slow_source():
+            for i in range(1000):
+                read.append(i)
+                yield i
+
+        threads_before = threading.active_count()
+        self.assertEqual(slow_source() | buffer(maxsize=2, batch_size=10) | head(5) | to_list(), list(range(5)))
+        gc.collect()  # pipe elements reference their own generators, so they are freed by the garbage collector
+        time.sleep(0.3)
+        self.assertLess(len(read), 100)  # reading stopped, not drained the whole source
+        self.assertEqual(threading.active_count(), threads_before)
+
+    def test_tee(self):
+        lines = ["line {}".format(i) for i in range(10000)]
+        errors = []
+        stage = tee(lambda stream: errors.extend(stream | grep("7$")) or "done", grep("^line 99"), wc(Flags.L),
+                    to_file("/tmp/pysh_tee_test"), maxsize=2, batch_size=100)
+        self.assertEqual(cat_list(lines) | stage | str.upper | to_list(), [line.upper() for line in lines])
+        self.assertEqual(errors, [line for line in lines if line.endswith("7")])
+        self.assertEqual(stage.results[0], "done")
+        self.assertEqual(stage.results[1], [line for line in lines if line.startswith("line 99")])
+        self.assertEqual(stage.results[2][0], 10000)
+        self.assertEqual(cat("/tmp/pysh_tee_test") | to_list(), lines)
+        rm("/tmp/pysh_tee_test")
+
+        with self.assertRaises(ValueError):
+            range(100) | tee(lambda stream: [_fail_on_13(x) for x in stream], batch_size=5) | to_list()
+        stage = tee(lambda stream: stream | head(3) | to_list(), maxsize=1, batch_size=10)
+        self.assertEqual(range(1000) | stage | to_list(), list(range(1000)))  # a branch may stop consuming early
+        self.assertEqual(stage.results, [[0, 1, 2]])
+
+    def test_fork(self):
+        threads_before = threading.active_count()
+        errors, count, first = map(str, range(1000)) | fork(lambda lines: [n for n in lines if n.endswith("00")],
+                                                            wc(Flags.L), lambda lines: next(iter(lines)), batch_size=64)
+        self.assertEqual(errors, ["100", "200", "300", "400", "500", "600", "700", "800", "900"])
+        self.assertEqual(count[0], 1000)
+        self.assertEqual(first, "0")
+        with self.assertRaises(ValueError):
+            range(100) | fork(to_list(), lambda numbers: [_fail_on_13(x) for x in numbers])
+        self.assertEqual(threading.active_count(), threads_before)
@@ -0,0 +1,36 @@
+import re
+import unittest
+
+import regex
+
+from pysh import cat_list, grep, sed, to_list, rm, mkdir, Flags, set_regex_engine, compile_regex
+
+
+class RegexEngineTest(unittest.TestCase):
+
+    def tearDown(self):
+        set_regex_engine("re")
+
+    def test_compile_regex(self):
+        self.assertIs(compile_regex("a+b"), compile_regex("a+b"))
+        self.assertIsInstance(compile_regex("a+b"), re.Pattern)
+        pattern = compile_regex("a+b")
+        self.assertIs(compile_regex(pattern), pattern)
+        self.assertEqual(compile_regex(pattern, re.IGNORECASE).flags & re.IGNORECASE, re.IGNORECASE)
+        with self.assertRaises(ValueError):
+            set_regex_engine("pcre")
+
+    def test_regex_engine(self):
+        set_regex_engine("regex")
+        self.assertIsInstance(compile_regex("a+b"), regex.Pattern)
+        self.assertEqual(cat_list(["zażółć", "abc", "123"]) | grep(r"\p{Ll}{3}") | to_list(), ["zażółć", "abc"])
+        self.assertEqual(cat_list(["abc", "ABD"]) | grep("ab", Flags.I | Flags.V) | to_list(), [])
+        self.assertEqual(cat_list(["a1b22"]) | sed("s", r"\p{Nd}+", "#", Flags.G) | to_list(), ["a#b#"])
+
+        mkdir("/tmp/pysh_regex_dir")
+        for i in range(4):
+            with open("/tmp/pysh_regex_dir/{}.txt".format(i), "w") as outfile:
+                outfile.write("line {}\nother\n".format(i))
+        result = grep(r"line \d", Flags.N, files="/tmp/pysh_regex_dir", recursive=True, workers=2) | to_list()
+        self.assertEqual(sorted(line for filename, num, line in result), ["line 0", "line 1", "line 2", "line 3"])
+        rm("/tmp/pysh_regex_dir", Flags.R)
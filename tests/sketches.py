@@ -0,0 +1,66 @@
+import pickle
+import random
+import unittest
+from collections import Counter
+
+from pysh import cat_list, top_k, count_distinct, quantiles
+from pysh.sketches import BloomFilter
+
+
+class SketchesTest(unittest.TestCase):
+
+    def test_top_k(self):
+        random.seed(0)
+        data = [int(random.paretovariate(1.5)) for _ in range(50000)]
+        expected = Counter(data).most_common(3)
+        sketch = cat_list(data) | top_k(3)
+        self.assertEqual(sketch.most_common(), expected)
+        half = len(data) // 2
+        merged = (data[:half] | top_k(3, capacity=20)).merge(pickle.loads(pickle.dumps(data[half:] | top_k(3, capacity=20))))
+        self.assertEqual([elem for elem, _ in merged.most_common()], [elem for elem, _ in expected])
+        for elem, count in merged.most_common():
+            self.assertLessEqual(count - merged.errors[elem], Counter(data)[elem])
+            self.assertGreaterEqual(count, Counter(data)[elem])
+        self.assertEqual(merged.total, len(data))
+        self.assertEqual(repr([] | top_k()), "[]")
+
+    def test_count_distinct(self):
+        random.seed(0)
+        data = [str(random.randint(0, 10 ** 6)) for _ in range(100000)]
+        distinct = len(set(data))
+        sketch = cat_list(data) | count_distinct()
+        self.assertLess(abs(sketch.estimate() - distinct) / distinct, 0.03)
+        merged = (data[:50000] | count_distinct()).merge(data[50000:] | count_distinct())
+        self.assertEqual(merged.estimate(), sketch.estimate())
+        self.assertEqual(len(cat_list(["a", "b", "a", 1, (1, 2)]) | count_distinct()), 4)
+        with self.assertRaises(ValueError):
+            sketch.merge(count_distinct(10))
+
+    def test_quantiles(self):
+        random.seed(0)
+        data = [random.random() for _ in range(100000)]
+        sketch = cat_list(data) | quantiles(seed=0)
+        for q, value in zip([0.1, 0.5, 0.9], sketch.quantiles([0.1, 0.5, 0.9])):
+            self.assertLess(abs(value - q), 0.02)
+        self.assertLess(abs(sketch.rank(0.25) - 0.25), 0.02)
+        self.assertLess(len(sum(sketch.compactors, [])), 1000)
+        merged = (data[:30000] | quantiles(seed=1)).merge(data[30000:] | quantiles(seed=2))
+        self.assertEqual(merged.count, len(data))
+        self.assertLess(abs(merged.quantile(0.5) - 0.5), 0.02)
+        self.assertEqual((cat_list([3, 1, 2]) | quantiles()).quantiles([0, 0.5, 1]), [1, 2, 3])
+        self.assertIsNone(([] | quantiles()).quantile(0.5))
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000, 0.01)
+        self.assertFalse(bloom.add("a"))
+        self.assertTrue(bloom.add("a"))
+        for i in range(1000):
+            bloom.add(i)
+        self.assertTrue(all(i in bloom for i in range(1000)))
+        false_positives = sum(i in bloom for i in range(1000, 11000))
+        self.assertLess(false_positives, 300)
+        other = BloomFilter(1000, 0.01)
+        other.add("b")
+        self.assertIn("b", bloom.merge(other))
+        with self.assertRaises(ValueError):
+            bloom.merge(BloomFilter(10))
@@ -1,7 +1,18 @@
+import bz2
+import gc
+import gzip
+import lzma
+import random
+import subprocess
+import sys
+import time
 import unittest
 from pathlib import Path
+from unittest.mock import patch
 
-from pysh import cat, cat_list, rm, to_bz2, bz2_cat, to_list
+import pysh.sources
+
+from pysh import cat, cat_list, rm, to_bz2, bz2_cat, gz_cat, xz_cat, zcat, to_list, sh, head, tail, grep, CommandError
 
 
 class SourcesTest(unittest.TestCase):
@@ -21,6 +32,32 @@ class SourcesTest(unittest.TestCase):
         self.assertEqual(list(gen), ["a", "b", "cde", "bde", ""])
         self.assertEqual(len(gen), 5)
 
+    def test_cat_indexed(self):
+        index_path = Path("/tmp/.pysh_cat_test.pysh_index")
+        gen = cat("/tmp/pysh_cat_test", indexed=True)
+        self.assertTrue(index_path.exists())
+        self.assertEqual(len(gen), 5)
+        self.assertEqual((gen[0], gen[2], gen[-2]), ("a", "cde", "bde"))
+        self.assertEqual(list(gen[1:3]), ["b", "cde"])
+        self.assertEqual(list(reversed(gen)), ["", "bde", "cde", "b", "a"])
+        self.assertEqual(list(gen), ["a", "b", "cde", "bde", ""])
+        self.assertEqual(cat("/tmp/pysh_cat_test", indexed=True) | tail(2) | to_list(), ["bde", ""])
+        self.assertEqual(cat("/tmp/pysh_cat_test", indexed=True) | tail(-3) | to_list(), ["bde", ""])
+        self.assertEqual(cat("/tmp/pysh_cat_test", indexed=True) | head(-2) | to_list(), ["a", "b", "cde"])
+        gen = cat("/tmp/pysh_cat_test", indexed=True)
+        next(gen)
+        self.assertEqual(gen | tail(10) | to_list(), ["b", "cde", "bde", ""])
+        with cat("/tmp/pysh_cat_test", indexed=True) as gen:  # the saved index is used
+            self.assertIsNotNone(gen._index)
+            self.assertEqual(gen[3], "bde")
+        self.assertTrue(gen._data.closed and gen._index is None)
+
+        with open("/tmp/pysh_cat_test", "a") as outfile:
+            outfile.write("xyz\r\nlast")
+        gen = cat("/tmp/pysh_cat_test", indexed=True)  # index is rebuilt after the file changed
+        self.assertEqual(list(gen[-2:]), ["xyz", "last"])
+        rm(index_path)
+
     def test_cat_list(self):
         lst = ['a', 'b', 'cde', 'fgh', 'x']
         self.assertEqual(list(cat_list(lst[:])), lst)
@@ -46,3 +83,73 @@ class SourcesTest(unittest.TestCase):
         self.assertEqual(len(gen), 4)
         self.assertEqual(content, list(gen))
         rm(FNAME)
+
+    def test_bz2_cat_parallel(self):
+        FNAME = '/tmp/pysh_bz2_test.bz2'
+        random.seed(0)
+        content = ["{} {} ×÷".format(i, random.random()) for i in range(50000)]
+        data = ("\n".join(content) + "\n").encode()
+        with open(FNAME, "wb") as outfile:  # two streams, with multiple blocks each
+            outfile.write(bz2.compress(data, 1) + bz2.compress("\n".join(content[:40]).encode(), 9))
+        expected = content + content[:40]
+        self.assertEqual(bz2_cat(FNAME, workers=3) | to_list(), expected)
+        self.assertEqual(len(bz2_cat(FNAME, with_len=True, workers=2)), len(expected))
+        with patch("pysh.sources._BZ2_SCAN_WINDOW", 1000):
+            self.assertEqual(bz2_cat(FNAME, workers=2) | to_list(), expected)
+
+        markers = pysh.sources._bz2_markers
+
+        def with_false_marker(data):  # as if the magic number of a block appeared inside compressed data
+            found = list(markers(data))
+            for (bit, is_block), (next_bit, _) in zip(found, found[1:] + [(None, None)]):
+                yield bit, is_block
+                if is_block:
+                    yield (bit + next_bit) // 2, True
+
+        with patch("pysh.sources._bz2_markers", with_false_marker):
+            self.assertEqual(bz2_cat(FNAME, workers=2) | to_list(), expected)
+        with open(FNAME, "wb") as outfile:
+            outfile.write(bz2.compress(data, 1)[:-1000])
+        with self.assertRaises(OSError):
+            bz2_cat(FNAME, workers=2) | to_list()
+        rm(FNAME)
+
+    def test_compressed_cat(self):
+        content = ['a', 'bc', '', 'ĄĘ', 'last']
+        data = "a\nbc\r\n\nĄĘ\nlast".encode()
+        for suffix, compress in [("gz", gzip.compress), ("xz", lzma.compress), ("bz2", bz2.compress), ("txt", bytes)]:
+            FNAME = '/tmp/pysh_compressed_test.' + suffix
+            with open(FNAME, "wb") as outfile:
+                outfile.write(compress(data))
+            self.assertEqual(zcat(FNAME, encoding="utf-8") | to_list(), content)
+            self.assertEqual(len(zcat(FNAME, with_len=True)), 5)
+            if suffix == "gz":
+                self.assertEqual(gz_cat(FNAME, encoding="utf-8") | to_list(), content)
+            elif suffix == "xz":
+                self.assertEqual(len(xz_cat(FNAME, with_len=True, encoding="utf-8")), 5)
+            rm(FNAME)
+
+    def test_sh(self):
+        self.assertEqual(sh("printf 'a\\nb\\n\\nc'") | to_list(), ['a', 'b', '', 'c'])
+        self.assertEqual(sh("printf 'a\\rb\\r\\nc\\n'") | to_list(), ['a\rb', 'c'])
+        self.assertEqual(sh("cat /tmp/pysh_cat_test") | grep("b") | to_list(), ["b", "bde"])
+        self.assertEqual(sh("printf '\\372\\n'", encoding="latin-1") | to_list(), ['ú'])
+        with self.assertRaises(CommandError) as error:
+            sh("echo a; echo failure >&2; exit 3") | to_list()
+        self.assertIn("failure", str(error.exception))
+        self.assertEqual(sh("echo a; exit 3", raise_on_error=False) | to_list(), ['a'])
+
+        lines = sh("yes; sleep 10")
+        self.assertEqual(lines | head(3) | to_list(), ['y', 'y', 'y'])
+        del lines
+        start = time.monotonic()
+        gc.collect()  # closes the generator, which kills the command instead of waiting for it
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_sh_at_exit(self):
+        # the generator stopped by head is closed only at interpreter shutdown, while stderr is still being read
+        script = "from pysh import sh, head, to_list; print(sh('yes') | head(3) | to_list())"
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, timeout=60,
+                                cwd=Path(__file__).parent.parent)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), b"['y', 'y', 'y']")